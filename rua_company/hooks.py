@@ -104,10 +104,11 @@ add_to_apps_screen = [
 # ----------
 
 # add methods and filters to jinja environment
-# jinja = {
-# 	"methods": "rua_company.utils.jinja_methods",
-# 	"filters": "rua_company.utils.jinja_filters"
-# }
+jinja = {
+	"methods": [
+		"rua_company.utils.qr.get_qr_code_data_uri"
+	]
+}
 
 # Installation
 # ------------
@@ -167,12 +168,43 @@ add_to_apps_screen = [
 doc_events = {
 	"Scope Items": {
 		"on_update": "rua_company.rua_company.doctype.bill.bill.handle_scope_item_update"
+	},
+	"Bill": {
+		"on_submit": "rua_company.rua_company.doctype.project_kpi.project_kpi.handle_bill_submit",
+		"on_cancel": "rua_company.rua_company.doctype.project_kpi.project_kpi.handle_bill_cancel"
+	},
+	"Payment Voucher": {
+		"on_submit": [
+			"rua_company.rua_company.doctype.project_kpi.project_kpi.handle_payment_voucher_submit",
+			"rua_company.rua_company.doctype.vat_ledger.vat_ledger.handle_payment_voucher_submit"
+		],
+		"on_cancel": [
+			"rua_company.rua_company.doctype.project_kpi.project_kpi.handle_payment_voucher_cancel",
+			"rua_company.rua_company.doctype.vat_ledger.vat_ledger.handle_payment_voucher_cancel"
+		]
+	},
+	"Project": {
+		"on_update": "rua_company.rua_company.doctype.project_kpi.project_kpi.handle_project_update",
+		"on_trash": "rua_company.rua_company.doctype.project_kpi.project_kpi.handle_project_trash"
 	}
 }
 
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"cron": {
+		"* * * * *": [
+			"rua_company.rua_company.doctype.bill.bill.process_bill_refreshes"
+		]
+	},
+	"daily": [
+		"rua_company.rua_company.doctype.project_kpi.project_kpi.reconcile_all_project_kpis",
+		"rua_company.rua_company.doctype.vat_ledger.vat_ledger.reconcile_vat_ledger",
+		"rua_company.rua_company.doctype.rua.rua.delete_old_report_files"
+	]
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"rua_company.tasks.all"
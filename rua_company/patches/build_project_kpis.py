@@ -0,0 +1,5 @@
+from rua_company.rua_company.doctype.project_kpi.project_kpi import reconcile_project_kpi
+
+
+def execute():
+	reconcile_project_kpi()
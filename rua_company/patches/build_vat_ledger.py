@@ -0,0 +1,5 @@
+from rua_company.rua_company.doctype.vat_ledger.vat_ledger import rebuild_vat_ledger
+
+
+def execute():
+	rebuild_vat_ledger()
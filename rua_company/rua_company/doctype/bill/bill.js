@@ -48,15 +48,18 @@ frappe.ui.form.on("Bill", {
               if (selected.length > 0) {
                 frappe.call({
                   method:
-                    "rua_company.rua_company.doctype.bill.bill.get_scope_item_data",
+                    "rua_company.rua_company.doctype.bill.bill.get_scope_items_data",
                   args: {
-                    scope_item: selected[0],
+                    scope_items: selected,
                   },
+                  freeze: true,
                   callback: function (r) {
                     if (r.message) {
-                      let row = frm.add_child("scope_items");
-                      row.scope_item = r.message.scope_item;
-                      row.data = JSON.stringify(r.message.data);
+                      r.message.forEach((result) => {
+                        let row = frm.add_child("scope_items");
+                        row.scope_item = result.scope_item;
+                        row.data = JSON.stringify(result.data);
+                      });
                       frm.refresh_field("scope_items");
                       frm.save();
                       d.hide();
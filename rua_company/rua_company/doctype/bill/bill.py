@@ -3,8 +3,20 @@
 
 import frappe
 import json
+import time
 from frappe.model.document import Document
-from frappe.utils import cint
+from frappe.utils import cint, get_datetime
+from rua_company.rua_company.doctype.document_sequence.document_sequence import next_value, release_value
+
+# Bills waiting for a refresh, mapped to the time of their first and last scope edit
+BILL_REFRESH_FIRST_KEY = 'bill_refresh_first'
+BILL_REFRESH_LAST_KEY = 'bill_refresh_last'
+# Refreshes are started by a once-a-minute scheduler tick, so a bill is refreshed
+# up to a minute after its edits: on the first tick once it has been quiet for
+# BILL_REFRESH_DEBOUNCE seconds, or once it has waited BILL_REFRESH_MAX_WAIT
+# seconds even though edits keep coming
+BILL_REFRESH_DEBOUNCE = 10
+BILL_REFRESH_MAX_WAIT = 300
 
 class Bill(Document):
 	def autoname(self):
@@ -27,8 +39,19 @@ class Bill(Document):
 			self.payment_status = 'Unpaid'
 	
 	def on_submit(self):
-		"""Set bill_number based on highest bill number for same project and bill_type"""
-		# Get the highest bill number for the same project and bill type
+		"""Allocate bill_number from the (project, bill_type) sequence"""
+		self.bill_number = next_value(
+			"Bill",
+			project=self.project,
+			bill_type=self.bill_type,
+			seed=self.get_highest_bill_number
+		)
+		
+		# Save the changes
+		self.db_set('bill_number', self.bill_number)
+	
+	def get_highest_bill_number(self):
+		"""Highest bill number for the same project and bill type, seeds the sequence"""
 		highest_bill = frappe.get_all(
 			"Bill",
 			filters={
@@ -41,42 +64,36 @@ class Bill(Document):
 			order_by="bill_number desc",
 			limit=1
 		)
-		
-		# Set bill_number to highest + 1, or 1 if no previous bills exist
-		if highest_bill:
-			self.bill_number = (highest_bill[0].bill_number or 0) + 1
-		else:
-			self.bill_number = 1
-		
-		# Save the changes
-		self.db_set('bill_number', self.bill_number)
+		return (highest_bill[0].bill_number or 0) if highest_bill else 0
 	
 	def on_cancel(self):
 		"""Reconcile bill numbers after cancellation"""
-		# Get all bills with higher numbers
-		subsequent_bills = frappe.get_all(
+		# Lock the sequence first so renumbering can't race with a submit
+		release_value(
 			"Bill",
-			filters={
-				"project": self.project,
-				"bill_type": self.bill_type,
-				"docstatus": 1,  # Only consider submitted documents
-				"bill_number": (">", self.bill_number)  # Get bills with higher numbers
-			},
-			fields=["name", "bill_number"],
-			order_by="bill_number asc"
+			project=self.project,
+			bill_type=self.bill_type,
+			seed=lambda: max(self.get_highest_bill_number(), cint(self.bill_number))
 		)
 		
-		# Update bill numbers for all subsequent bills
-		for bill in subsequent_bills:
-			frappe.db.set_value(
-				"Bill",
-				bill.name,
-				"bill_number",
-				bill.bill_number - 1
-			)
-		
-		if subsequent_bills:
-			frappe.db.commit()
+		# Shift every later bill down in one statement, inside the cancel transaction.
+		# modified is bumped as set_value did, so cached prints of these bills go stale
+		frappe.db.sql("""
+			UPDATE `tabBill`
+			SET bill_number = bill_number - 1,
+				modified = %(now)s,
+				modified_by = %(user)s
+			WHERE project = %(project)s
+				AND bill_type = %(bill_type)s
+				AND docstatus = 1
+				AND bill_number > %(bill_number)s
+		""", {
+			"now": frappe.utils.now(),
+			"user": frappe.session.user,
+			"project": self.project,
+			"bill_type": self.bill_type,
+			"bill_number": cint(self.bill_number)
+		})
 	
 	def update_totals(self):
 		"""Update bill totals by summing scope item totals of the same type"""
@@ -96,11 +113,22 @@ class Bill(Document):
 		self.vat_amount = 0
 		self.grand_total = 0
 		
+		# Fetch only what is needed from all referenced scope items in one query
+		scope_item_names = list({item.scope_item for item in self.scope_items if item.scope_item})
+		scope_docs = {
+			scope_doc.name: scope_doc
+			for scope_doc in frappe.get_all(
+				'Scope Items',
+				filters={'name': ['in', scope_item_names]},
+				fields=['name', 'scope_type', 'totals_data']
+			)
+		} if scope_item_names else {}
+		
 		for item in self.scope_items:
-			if not item.scope_item:
+			scope_doc = scope_docs.get(item.scope_item)
+			if not scope_doc:
 				continue
 				
-			scope_doc = frappe.get_doc('Scope Items', item.scope_item)
 			if scope_doc.scope_type not in scope_items_by_type:
 				scope_items_by_type[scope_doc.scope_type] = []
 			scope_items_by_type[scope_doc.scope_type].append(scope_doc)
@@ -123,18 +151,14 @@ class Bill(Document):
 		
 		# Process each scope type
 		for scope_type, scope_items in scope_items_by_type.items():
-			scope_type_doc = frappe.get_doc('Scope Type', scope_type)
-			
 			# Get billable formulas for this scope type
-			billable_formulas = [
-				formula.field_name 
-				for formula in scope_type_doc.calculation_formulas 
-				if hasattr(formula, 'in_bill') and cint(formula.in_bill)
-			]
+			billable_formulas = get_scope_type_bill_config(scope_type)['formulas']
 			
 			# Sum totals for this scope type
 			type_totals = {}
 			for scope_doc in scope_items:
+				if not scope_doc.totals_data:
+					continue
 				totals_data = json.loads(scope_doc.totals_data) if isinstance(scope_doc.totals_data, str) else scope_doc.totals_data
 				if not totals_data:
 					continue
@@ -161,16 +185,17 @@ class Bill(Document):
 		# Update bill's data field
 		self.data = json.dumps(bill_totals) if bill_totals else "{}"
 
-	def refresh_scope_item_data(self, scope_item_name):
-		"""Refresh data for a specific scope item in the bill"""
+	def refresh_scope_item_data(self, scope_item_name=None):
+		"""Refresh data for a specific scope item in the bill, or all of them"""
 		if not self.auto_update_items or self.docstatus != 0:
 			return
 
 		for item in self.scope_items:
-			if item.scope_item == scope_item_name:
+			if not item.scope_item:
+				continue
+			if scope_item_name is None or item.scope_item == scope_item_name:
 				# Fetch fresh data
-				scope_doc = frappe.get_doc('Scope Items', scope_item_name)
-				result = get_scope_item_data(scope_item_name)
+				result = get_scope_item_data(item.scope_item)
 				if result and 'data' in result:
 					item.data = json.dumps(result['data'])
 		
@@ -181,33 +206,61 @@ class Bill(Document):
 @frappe.whitelist()
 def get_scope_item_data(scope_item):
 	"""Get scope item data with fields filtered by in_bill flag"""
-	scope_doc = frappe.get_doc('Scope Items', scope_item)
-	
-	result = {
+	return {
 		'scope_item': scope_item,
 		'data': {
-			scope_item: {
-				'items': {},
-				'totals': {},
-				'constants': {}
-			}
+			scope_item: get_cached_billable_projection(scope_item)
 		}
 	}
+
+def get_cached_billable_projection(scope_item):
+	"""Get the billable projection of a Scope Items, cached per document version (modified)"""
+	modified = frappe.db.get_value('Scope Items', scope_item, 'modified')
+	cached = frappe.cache.get_value(f'scope_items_bill_projection::{scope_item}')
+	if modified and cached and cached['modified'] == str(get_datetime(modified)):
+		return cached['projection']
 	
-	if not scope_doc.items:
-		return result
-				
-	# Get the scope type document to access field configurations
-	scope_type_doc = frappe.get_doc('Scope Type', scope_doc.scope_type)
+	scope_doc = frappe.get_doc('Scope Items', scope_item)
+	return cache_billable_projection(scope_doc)
+
+def cache_billable_projection(scope_doc, projection=None):
+	"""Store the billable projection of a Scope Items for its current version"""
+	if projection is None:
+		projection = get_billable_projection(scope_doc)
+	
+	frappe.cache.set_value(
+		f'scope_items_bill_projection::{scope_doc.name}',
+		{
+			'modified': str(get_datetime(scope_doc.modified)),
+			'projection': projection
+		}
+	)
+	return projection
+
+@frappe.whitelist()
+def get_scope_items_data(scope_items):
+	"""Get billable data for several scope items in one call"""
+	scope_items = frappe.parse_json(scope_items)
 	
-	# Create a lookup dictionary for field configurations
-	field_config_dict = {}
-	for fc in scope_type_doc.scope_fields:
-		if hasattr(fc, 'field_name') and hasattr(fc, 'in_bill'):
-			field_config_dict[fc.field_name] = {
-				'in_bill': fc.in_bill,
-				'unit': fc.unit if hasattr(fc, 'unit') else ''
-			}
+	return [
+		get_scope_item_data(scope_item)
+		for scope_item in dict.fromkeys(scope_items)
+	]
+
+def get_billable_projection(scope_doc):
+	"""Build the in_bill projection (items, totals, constants) of a Scope Items document"""
+	projection = {
+		'items': {},
+		'totals': {},
+		'constants': {}
+	}
+	
+	if not scope_doc.items:
+		return projection
+					
+	# Get the billable field configuration of the scope type
+	bill_config = get_scope_type_bill_config(scope_doc.scope_type)
+	billable_fields = bill_config['fields']
 	
 	# Process items data
 	for idx, item in enumerate(scope_doc.items):
@@ -216,7 +269,7 @@ def get_scope_item_data(scope_item):
 			continue
 			
 		# Parse data if it's a string
-		item_data = json.loads(item.data) if isinstance(item.data, str) else item_data
+		item_data = json.loads(item.data) if isinstance(item.data, str) else item.data
 		
 		# Create entry for this item
 		row_data = {
@@ -225,62 +278,129 @@ def get_scope_item_data(scope_item):
 		
 		# Add fields where in_bill is True
 		for field_name, value in item_data.items():
-			if field_name in field_config_dict and cint(field_config_dict[field_name]['in_bill']):
+			if field_name in billable_fields:
 				row_data[field_name] = value
-				if field_config_dict[field_name]['unit']:
-					row_data[f"{field_name}_unit"] = field_config_dict[field_name]['unit']
+				if billable_fields[field_name]:
+					row_data[f"{field_name}_unit"] = billable_fields[field_name]
 		
-		# Add this item's data to the result using row_id as key
-		result['data'][scope_item]['items'][item.row_id] = row_data
+		# Add this item's data to the projection using row_id as key
+		projection['items'][item.row_id] = row_data
 	
 	# Process totals data
 	totals_data = json.loads(scope_doc.totals_data) if isinstance(scope_doc.totals_data, str) else scope_doc.totals_data
 	if totals_data:
-		# Get calculation formulas with in_bill=1
-		billable_formulas = {
-			formula.field_name: True 
-			for formula in scope_type_doc.calculation_formulas 
-			if hasattr(formula, 'in_bill') and cint(formula.in_bill)
-		}
-		
 		# Add only billable totals
 		for field_name, value in totals_data.items():
-			if field_name in billable_formulas:
-				result['data'][scope_item]['totals'][field_name] = value
+			if field_name in bill_config['formulas']:
+				projection['totals'][field_name] = value
 	
 	# Process constants data
 	constants_data = json.loads(scope_doc.constants_data) if isinstance(scope_doc.constants_data, str) else scope_doc.constants_data
 	if constants_data:
-		# Get constants with in_bill=1
-		billable_constants = {
-			constant.constant_name: True 
-			for constant in scope_type_doc.constants 
-			if hasattr(constant, 'in_bill') and cint(constant.in_bill)
-		}
-		
 		# Add only billable constants
 		for field_name, value in constants_data.items():
-			if field_name in billable_constants:
-				result['data'][scope_item]['constants'][field_name] = value
+			if field_name in bill_config['constants']:
+				projection['constants'][field_name] = value
 			
-	return result
+	return projection
 
-def handle_scope_item_update(doc, method):
-	"""Handler for scope item document updates"""
-	# Find all draft bills that have auto_update enabled and contain this scope item
-	bills = frappe.get_all(
+def get_scope_type_bill_config(scope_type):
+	"""Get the in_bill fields (with units), formulas and constants of a scope type (cached)"""
+	def build():
+		scope_type_doc = frappe.get_doc('Scope Type', scope_type)
+		return {
+			'fields': {
+				fc.field_name: fc.unit or ''
+				for fc in scope_type_doc.scope_fields
+				if cint(fc.in_bill)
+			},
+			'formulas': [
+				formula.field_name
+				for formula in scope_type_doc.calculation_formulas
+				if cint(formula.in_bill)
+			],
+			'constants': [
+				constant.constant_name
+				for constant in scope_type_doc.constants
+				if cint(constant.in_bill)
+			]
+		}
+
+	return frappe.cache.hget('scope_type_bill_config', scope_type, generator=build)
+
+def on_doctype_update():
+	# Supports bill numbering and renumbering per project and bill type
+	frappe.db.add_index("Bill", ["project", "bill_type", "bill_number"])
+
+def get_bills_for_scope_item(scope_item):
+	"""Get draft auto-updating bills that reference a scope item"""
+	return frappe.get_all(
 		'Bill',
-		filters={
-			'docstatus': 0,
-			'auto_update_items': 1
-		},
-		fields=['name']
+		filters=[
+			['Bill', 'docstatus', '=', 0],
+			['Bill', 'auto_update_items', '=', 1],
+			['Bill Items', 'scope_item', '=', scope_item]
+		],
+		distinct=True,
+		pluck='name'
 	)
-	
-	for bill in bills:
-		# Check if this scope item is in the bill
-		bill_doc = frappe.get_doc('Bill', bill.name)
-		for item in bill_doc.scope_items:
-			if item.scope_item == doc.name:
-				bill_doc.refresh_scope_item_data(doc.name)
-				break
+
+def handle_scope_item_update(doc, method):
+	"""Handler for scope item document updates"""
+	# Nothing a bill shows has changed
+	if not doc.has_value_changed('bill_digest'):
+		return
+
+	# Only touch bills that actually reference this scope item
+	for bill_name in get_bills_for_scope_item(doc.name):
+		enqueue_bill_refresh(bill_name)
+
+def enqueue_bill_refresh(bill_name):
+	"""Mark a bill for refresh; process_bill_refreshes picks it up once edits settle"""
+	def touch():
+		# Raw redis calls: HSETNX keeps the first edit time when saves race
+		now = time.time()
+		pipeline = frappe.cache.pipeline()
+		pipeline.hsetnx(frappe.cache.make_key(BILL_REFRESH_FIRST_KEY), bill_name, now)
+		pipeline.hset(frappe.cache.make_key(BILL_REFRESH_LAST_KEY), bill_name, now)
+		pipeline.execute()
+
+	# Marked after commit so a refresh never reads data older than the mark
+	frappe.db.after_commit.add(touch)
+
+def process_bill_refreshes():
+	"""Scheduler tick: enqueue a refresh for every bill whose scope edits have settled"""
+	pipeline = frappe.cache.pipeline()
+	pipeline.hgetall(frappe.cache.make_key(BILL_REFRESH_FIRST_KEY))
+	pipeline.hgetall(frappe.cache.make_key(BILL_REFRESH_LAST_KEY))
+	first_edits, last_edits = pipeline.execute()
+
+	now = time.time()
+	for bill_name, last in last_edits.items():
+		first = first_edits.get(bill_name, last)
+		if now - float(last) < BILL_REFRESH_DEBOUNCE and now - float(first) < BILL_REFRESH_MAX_WAIT:
+			continue
+
+		bill_name = frappe.safe_decode(bill_name)
+		frappe.enqueue(
+			'rua_company.rua_company.doctype.bill.bill.refresh_bill',
+			queue='short',
+			job_id=f'bill_refresh::{bill_name}',
+			deduplicate=True,
+			bill_name=bill_name
+		)
+
+def refresh_bill(bill_name):
+	"""Background job: refresh all scope item rows of a bill and save once"""
+	# Cleared first: edits committed from here on mark the bill for the next tick
+	pipeline = frappe.cache.pipeline()
+	pipeline.hdel(frappe.cache.make_key(BILL_REFRESH_FIRST_KEY), bill_name)
+	pipeline.hdel(frappe.cache.make_key(BILL_REFRESH_LAST_KEY), bill_name)
+	pipeline.execute()
+
+	if not frappe.db.exists('Bill', bill_name):
+		return
+
+	bill_doc = frappe.get_doc('Bill', bill_name)
+	bill_doc.refresh_scope_item_data()
+	frappe.db.commit()
@@ -0,0 +1,17 @@
+// Copyright (c) 2026, Yamen Zakhour and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Bill"] = {
+  onload(listview) {
+    listview.page.add_action_item(__("Merged PDF"), () => {
+      const names = listview.get_checked_items(true);
+      if (!names.length) return;
+
+      // Rendered concurrently on the server and returned as a single file
+      window.open(
+        "/api/method/rua_company.utils.pdf.download_merged_pdf?" +
+          $.param({ doctype: "Bill", names: JSON.stringify(names) })
+      );
+    });
+  },
+};
@@ -0,0 +1,80 @@
+# Copyright (c) 2026, Yamen Zakhour and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import cint
+
+
+class DocumentSequence(Document):
+	pass
+
+def get_sequence_name(ref_doctype, project=None, bill_type=None):
+	"""Build the sequence key for (doctype, project, bill_type)"""
+	return "::".join([ref_doctype, project or "", bill_type or ""])
+
+def lock_sequence(ref_doctype, project=None, bill_type=None, seed=None):
+	"""Lock a sequence row for the rest of the transaction and return its name and current value
+
+	The row is created on first use, starting from `seed()` so numbering carries
+	on from existing documents.
+	"""
+	name = get_sequence_name(ref_doctype, project, bill_type)
+
+	# Seed missing rows before locking: a locking read of an absent row takes a gap
+	# lock, and two first uses would then deadlock on their inserts
+	if not frappe.db.exists("Document Sequence", name):
+		now = frappe.utils.now()
+		frappe.db.sql(
+			"""INSERT IGNORE INTO `tabDocument Sequence`
+				(name, creation, modified, owner, modified_by, docstatus, idx,
+				 ref_doctype, project, bill_type, current)
+			VALUES (%(name)s, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+				%(ref_doctype)s, %(project)s, %(bill_type)s, %(current)s)""",
+			{
+				"name": name,
+				"now": now,
+				"user": frappe.session.user,
+				"ref_doctype": ref_doctype,
+				"project": project,
+				"bill_type": bill_type,
+				"current": cint(seed() if seed else 0)
+			}
+		)
+
+	current = frappe.db.sql(
+		"SELECT current FROM `tabDocument Sequence` WHERE name = %s FOR UPDATE",
+		name
+	)
+
+	return name, cint(current[0][0])
+
+def next_value(ref_doctype, project=None, bill_type=None, seed=None):
+	"""Allocate the next number of a sequence"""
+	name, current = lock_sequence(ref_doctype, project, bill_type, seed)
+	current += 1
+	frappe.db.sql(
+		"UPDATE `tabDocument Sequence` SET current = %s WHERE name = %s",
+		(current, name)
+	)
+	return current
+
+def release_value(ref_doctype, project=None, bill_type=None, seed=None):
+	"""Step a sequence back by one, after a numbered document was removed from it"""
+	name, current = lock_sequence(ref_doctype, project, bill_type, seed)
+	current = max(current - 1, 0)
+	frappe.db.sql(
+		"UPDATE `tabDocument Sequence` SET current = %s WHERE name = %s",
+		(current, name)
+	)
+	return current
+
+def reset_sequence(ref_doctype, value, project=None, bill_type=None):
+	"""Move a sequence to `value` (or the result of calling it) under the row lock"""
+	name, current = lock_sequence(ref_doctype, project, bill_type)
+	current = cint(value() if callable(value) else value)
+	frappe.db.sql(
+		"UPDATE `tabDocument Sequence` SET current = %s WHERE name = %s",
+		(current, name)
+	)
+	return current
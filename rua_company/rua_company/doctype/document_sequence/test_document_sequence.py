@@ -0,0 +1,46 @@
+# Copyright (c) 2026, Yamen Zakhour and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rua_company.rua_company.doctype.document_sequence.document_sequence import (
+	get_sequence_name,
+	next_value,
+	release_value,
+)
+
+
+class TestDocumentSequence(FrappeTestCase):
+	def setUp(self):
+		self.bill_type = frappe.generate_hash(length=8)
+
+	def test_next_value_creates_row_from_seed(self):
+		self.assertEqual(next_value("Bill", bill_type=self.bill_type, seed=lambda: 41), 42)
+		self.assertEqual(next_value("Bill", bill_type=self.bill_type, seed=lambda: 41), 43)
+
+		name = get_sequence_name("Bill", bill_type=self.bill_type)
+		self.assertEqual(frappe.db.get_value("Document Sequence", name, "current"), 43)
+
+	def test_seed_only_used_for_new_rows(self):
+		next_value("Bill", bill_type=self.bill_type)
+		self.assertEqual(next_value("Bill", bill_type=self.bill_type, seed=lambda: 100), 2)
+
+	def test_release_value(self):
+		next_value("Bill", bill_type=self.bill_type)
+		next_value("Bill", bill_type=self.bill_type)
+
+		self.assertEqual(release_value("Bill", bill_type=self.bill_type), 1)
+		self.assertEqual(next_value("Bill", bill_type=self.bill_type), 2)
+
+	def test_release_value_never_goes_below_zero(self):
+		self.assertEqual(release_value("Bill", bill_type=self.bill_type), 0)
+		self.assertEqual(release_value("Bill", bill_type=self.bill_type), 0)
+		self.assertEqual(next_value("Bill", bill_type=self.bill_type), 1)
+
+	def test_sequences_are_separate_per_bill_type(self):
+		other = frappe.generate_hash(length=8)
+		next_value("Bill", bill_type=self.bill_type)
+		next_value("Bill", bill_type=self.bill_type)
+
+		self.assertEqual(next_value("Bill", bill_type=other), 1)
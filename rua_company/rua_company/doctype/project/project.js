@@ -687,6 +687,12 @@ function setupClickHandlers(frm) {
             showAddPartyDialog(frm);
         });
 
+        // Open the full list behind a dashboard card
+        $(frm.wrapper).find('.view-all-link').off('click').on('click', function() {
+            const filters = JSON.parse(decodeURIComponent($(this).data('filters')));
+            frappe.set_route('List', $(this).data('doctype'), {project: frm.doc.name, ...filters});
+        });
+
         // Add click handler for view items button
         $(frm.wrapper).find('[data-action="view-items"]').on('click', () => {
             showScopeItemsDialog(frm);
@@ -716,32 +722,54 @@ function setupDraftToggles(frm) {
     });
 }
 
-function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, additionalExpenses) {
+function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, additionalExpenses, summary) {
     // Group bills by type
     const groupedBills = {};
     const totals = {};
+    const counts = {};
     const allBillTypes = ['Purchase Order', 'Tax Invoice', 'Quotation', 'Proforma', 'Request for Quotation'];
     
     // Initialize all bill types with empty arrays
     allBillTypes.forEach(type => {
         groupedBills[type] = [];
         totals[type] = 0;
+        counts[type] = 0;
     });
 
     // Populate with actual bills
     bills.forEach(bill => {
         if (!groupedBills[bill.bill_type]) {
             groupedBills[bill.bill_type] = [];
-            totals[bill.bill_type] = 0;
         }
         groupedBills[bill.bill_type].push(bill);
-        totals[bill.bill_type] += bill.grand_total || 0;
     });
 
-    // Calculate voucher totals
-    const receiveTotal = receiveVouchers.reduce((sum, v) => sum + (v.payment_amount || 0), 0);
-    const payTotal = payVouchers.reduce((sum, v) => sum + (v.payment_amount || 0), 0);
-    const additionalExpensesTotal = additionalExpenses.reduce((sum, v) => sum + (v.payment_amount || 0), 0);
+    // Totals and counts cover all documents, not just the listed ones
+    Object.entries(summary.bill_totals).forEach(([type, bill_totals]) => {
+        totals[type] = bill_totals.total;
+        counts[type] = bill_totals.count;
+    });
+
+    const receiveTotal = summary.voucher_totals.receive.total;
+    const payTotal = summary.voucher_totals.pay.total;
+    const additionalExpensesTotal = summary.voucher_totals.petty_cash.total;
+    const voucherCounts = {
+        'Received Payments': summary.voucher_totals.receive.count,
+        'Paid Payments': summary.voucher_totals.pay.count,
+        'Additional Expenses': summary.voucher_totals.petty_cash.count
+    };
+    const voucherFilters = {
+        'Received Payments': {type: 'Receive'},
+        'Paid Payments': {type: 'Pay', petty_cash: 0},
+        'Additional Expenses': {type: 'Pay', petty_cash: 1}
+    };
+
+    // Only the most recent documents are listed, link to the rest
+    const generateViewAllLink = (count, listed, doctype, filters) => count > listed ? `
+        <a class="view-all-link" data-doctype="${doctype}" data-filters="${encodeURIComponent(JSON.stringify(filters))}">
+            View all ${count}
+        </a>
+    ` : '';
 
     // Generate bill card HTML
     const generateBillCard = (type, bills) => `
@@ -751,7 +779,7 @@ function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, addi
                     <div class="type-info">
                         <div class="title-row">
                             <span class="type-title">${type}</span>
-                            <span class="count-badge">${bills.length}</span>
+                            <span class="count-badge">${counts[type]}</span>
                         </div>
                         <label class="show-drafts-toggle">
                             <span class="toggle-label">Show Drafts</span>
@@ -794,6 +822,7 @@ function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, addi
                     `}
                 </div>
             </div>
+            ${generateViewAllLink(counts[type], bills.length, 'Bill', {bill_type: type})}
         </div>
     `;
 
@@ -805,7 +834,7 @@ function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, addi
                     <div class="type-info">
                         <div class="title-row">
                             <span class="type-title">${type}</span>
-                            <span class="count-badge">${vouchers.length}</span>
+                            <span class="count-badge">${voucherCounts[type]}</span>
                         </div>
                         <label class="show-drafts-toggle">
                             <span class="toggle-label">Show Drafts</span>
@@ -850,6 +879,7 @@ function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, addi
                     `}
                 </div>
             </div>
+            ${generateViewAllLink(voucherCounts[type], vouchers.length, 'Payment Voucher', voucherFilters[type])}
         </div>
     `;
 
@@ -1096,6 +1126,20 @@ function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, addi
                     font-size: 13px;
                     opacity: 0.8;
                 }
+                .view-all-link {
+                    display: block;
+                    padding: 10px 16px;
+                    border-top: 1px solid var(--gray-200);
+                    color: #4f46e5;
+                    font-size: 13px;
+                    font-weight: 500;
+                    text-align: center;
+                    cursor: pointer;
+                }
+                .view-all-link:hover {
+                    background: var(--gray-50);
+                    text-decoration: none;
+                }
                 .item-name-row {
                     display: flex;
                     align-items: center;
@@ -1166,76 +1210,25 @@ function generateOverviewSections(frm, bills, receiveVouchers, payVouchers, addi
 }
 
 function updateProjectDisplay(frm) {
-    // Get all bills at once and filter them in memory
-    const getBills = () => frappe.db.get_list('Bill', {
-        filters: {
-            'project': frm.doc.name,
-            'docstatus': ['in', [0, 1]] // Get both drafts and submitted
-        },
-        fields: ['name', 'bill_number', 'bill_type', 'creation', 'grand_total', 'date', 'payment_status', 'docstatus'],
-        order_by: 'creation desc',
-        limit: 1000
-    }).then(bills => {
-        // Calculate project costs from submitted Purchase Order bills
-        const projectCosts = bills
-            .filter(bill => bill.docstatus === 1 && bill.bill_type === 'Purchase Order')
-            .reduce((total, bill) => total + (bill.grand_total || 0), 0);
-        
-        // Calculate profit percentage
-        const contractValue = frm.doc.contract_value || 0;
-        const profitAmount = contractValue - projectCosts;
-        const profitPercentage = contractValue > 0 ? (profitAmount / contractValue * 100) : 0;
-        
-        // Filter bills based on their type and draft state
-        const filteredBills = bills.filter(bill => 
-            bill.docstatus === 1 || showDraftsState[bill.bill_type]
-        );
-        
-        return {
-            bills: filteredBills,
-            projectCosts,
-            profitAmount,
-            profitPercentage
-        };
-    });
-
-    const getReceiveVouchers = () => frappe.db.get_list('Payment Voucher', {
-        filters: {
-            'project': frm.doc.name,
-            'docstatus': showDraftsState['receive'] ? ['in', [0, 1]] : 1,
-            'type': 'Receive'
-        },
-        fields: ['name', 'date', 'payment_amount', 'docstatus'],
-        order_by: 'date desc',
-        limit: 1000
-    });
-
-    const getPayVouchers = () => frappe.db.get_list('Payment Voucher', {
-        filters: {
-            'project': frm.doc.name,
-            'docstatus': showDraftsState['pay'] ? ['in', [0, 1]] : 1,
-            'type': 'Pay',
-            'petty_cash': 0
-        },
-        fields: ['name', 'date', 'payment_amount', 'docstatus'],
-        order_by: 'date desc',
-        limit: 1000
-    });
-
-    const getAdditionalExpenses = () => frappe.db.get_list('Payment Voucher', {
-        filters: {
-            'project': frm.doc.name,
-            'docstatus': showDraftsState['pay'] ? ['in', [0, 1]] : 1,
-            'type': 'Pay',
-            'petty_cash': 1
-        },
-        fields: ['name', 'date', 'payment_amount', 'docstatus'],
-        order_by: 'date desc',
-        limit: 1000
-    });
+    // Totals are aggregated server-side, only recent documents are listed
+    frappe.call({
+        method: 'rua_company.rua_company.doctype.project.project.get_project_summary',
+        args: {
+            project: frm.doc.name,
+            show_drafts: showDraftsState
+        }
+    }).then(r => {
+            const summary = r.message;
+            const bills = {
+                bills: Object.values(summary.bills).flat(),
+                projectCosts: summary.project_costs,
+                profitAmount: summary.profit_amount,
+                profitPercentage: summary.profit_percentage
+            };
+            const receiveVouchers = summary.vouchers.receive;
+            const payVouchers = summary.vouchers.pay;
+            const additionalExpenses = summary.vouchers.petty_cash;
 
-    Promise.all([getBills(), getReceiveVouchers(), getPayVouchers(), getAdditionalExpenses()])
-        .then(([bills, receiveVouchers, payVouchers, additionalExpenses]) => {
             const getStatusStyle = (status) => {
                 const styles = {
                     'Tender': {
@@ -1606,7 +1599,7 @@ function updateProjectDisplay(frm) {
                             ${generatePartyChips(frm)}
                         </div>
                     </div>
-                    ${generateOverviewSections(frm, bills.bills, receiveVouchers, payVouchers, additionalExpenses)}
+                    ${generateOverviewSections(frm, bills.bills, receiveVouchers, payVouchers, additionalExpenses, summary)}
                 </div>
             `;
             
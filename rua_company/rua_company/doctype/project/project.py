@@ -3,28 +3,38 @@
 
 import frappe
 from frappe.model.document import Document
-from frappe.utils import today
+from frappe.utils import today, flt, cint
+from rua_company.rua_company.doctype.document_sequence.document_sequence import next_value, reset_sequence
 
 class Project(Document):
     def validate(self):
         if self.has_value_changed("status"):
             if self.status == "Cancelled":
+                self.release_serial_number()
                 self.serial_number = 0
             elif self.status == "In Progress":
                 self.serial_number = self.get_next_serial_number()
     
     def get_next_serial_number(self):
+        # Allocated under a row lock, seeded from existing projects on first use
+        return next_value("Project", seed=self.get_highest_serial_number)
+
+    def release_serial_number(self):
+        """Give the top serial number back when the project holding it is cancelled"""
+        if not self.serial_number:
+            return
+        reset_sequence("Project", lambda: self.get_highest_serial_number(exclude_self=True))
+
+    def get_highest_serial_number(self, exclude_self=False):
         # Get the highest serial number from existing projects (excluding cancelled)
         highest_serial = frappe.db.sql("""
             SELECT MAX(serial_number) 
             FROM tabProject 
             WHERE status != 'Cancelled'
-        """)[0][0]
+            {0}
+        """.format("AND name != %(name)s" if exclude_self else ""), {"name": self.name})[0][0]
         
-        # If no projects exist or all have serial_number 0, start from 1
-        return (highest_serial or 0) + 1
-
-    pass
+        return highest_serial or 0
 
 @frappe.whitelist()
 def create_additional_expense(self, party, date, amount, details):
@@ -52,3 +62,125 @@ def create_additional_expense(self, party, date, amount, details):
     except Exception as e:
         frappe.log_error(str(e), "Additional Expense Creation Error")
         raise e
+
+
+BILL_TYPES = ['Purchase Order', 'Tax Invoice', 'Quotation', 'Proforma', 'Request for Quotation']
+
+# Voucher groups shown on the dashboard: (key, type, petty_cash or None for any, drafts toggle)
+VOUCHER_GROUPS = [
+    ('receive', 'Receive', None, 'receive'),
+    ('pay', 'Pay', 0, 'pay'),
+    ('petty_cash', 'Pay', 1, 'pay')
+]
+
+@frappe.whitelist()
+def get_project_summary(project, show_drafts=None, start=0, page_length=20):
+    """Financial summary for the project dashboard
+
+    Totals come from GROUP BY queries so they are exact regardless of volume;
+    only the most recent documents of each group are returned for display, a
+    page at a time.
+    """
+    show_drafts = frappe.parse_json(show_drafts) if show_drafts else {}
+    start, page_length = cint(start), cint(page_length) or 20
+
+    summary = {
+        'project_costs': 0,
+        'profit_amount': 0,
+        'profit_percentage': 0,
+        'bill_totals': {bill_type: {'count': 0, 'total': 0} for bill_type in BILL_TYPES},
+        'voucher_totals': {key: {'count': 0, 'total': 0} for key, *_ in VOUCHER_GROUPS},
+        'bills': {bill_type: [] for bill_type in BILL_TYPES},
+        'vouchers': {key: [] for key, *_ in VOUCHER_GROUPS},
+        'kpi': None
+    }
+
+    if not project or not frappe.db.exists('Project', project):
+        return summary
+
+    frappe.has_permission('Project', 'read', project, throw=True)
+    can_read_bills = frappe.has_permission('Bill', 'read')
+    can_read_vouchers = frappe.has_permission('Payment Voucher', 'read')
+
+    def docstatuses(toggle):
+        return [0, 1] if show_drafts.get(toggle) else [1]
+
+    bill_rows = frappe.db.sql("""
+        SELECT bill_type, docstatus, COUNT(*) AS count, SUM(grand_total) AS total
+        FROM `tabBill`
+        WHERE project = %s AND docstatus IN (0, 1)
+        GROUP BY bill_type, docstatus
+    """, project, as_dict=True) if can_read_bills else []
+
+    for row in bill_rows:
+        if row.bill_type == 'Purchase Order' and row.docstatus == 1:
+            summary['project_costs'] += flt(row.total)
+        if row.docstatus in docstatuses(row.bill_type):
+            totals = summary['bill_totals'].setdefault(row.bill_type, {'count': 0, 'total': 0})
+            totals['count'] += row.count
+            totals['total'] += flt(row.total)
+
+    voucher_rows = frappe.db.sql("""
+        SELECT type, petty_cash, docstatus, COUNT(*) AS count, SUM(payment_amount) AS total
+        FROM `tabPayment Voucher`
+        WHERE project = %s AND docstatus IN (0, 1)
+        GROUP BY type, petty_cash, docstatus
+    """, project, as_dict=True) if can_read_vouchers else []
+
+    for key, voucher_type, petty_cash, toggle in VOUCHER_GROUPS:
+        for row in voucher_rows:
+            if row.type != voucher_type or row.docstatus not in docstatuses(toggle):
+                continue
+            if petty_cash is not None and cint(row.petty_cash) != petty_cash:
+                continue
+            summary['voucher_totals'][key]['count'] += row.count
+            summary['voucher_totals'][key]['total'] += flt(row.total)
+
+    # Submitted figures as maintained in Project KPI; project_costs above stays
+    # the exact figure, the KPI row is only reported alongside it
+    if can_read_bills and can_read_vouchers:
+        summary['kpi'] = frappe.db.get_value(
+            'Project KPI', project,
+            ['contract_value', 'po_costs', 'received', 'paid', 'petty_cash', 'outstanding'],
+            as_dict=True
+        )
+
+    contract_value = flt(frappe.db.get_value('Project', project, 'contract_value'))
+    summary['profit_amount'] = contract_value - summary['project_costs']
+    summary['profit_percentage'] = (
+        summary['profit_amount'] / contract_value * 100 if contract_value > 0 else 0
+    )
+
+    # Recent documents for display, through get_list so per-document permissions apply
+    for bill_type in summary['bill_totals'] if can_read_bills else []:
+        summary['bills'][bill_type] = frappe.get_list(
+            'Bill',
+            filters={
+                'project': project,
+                'bill_type': bill_type,
+                'docstatus': ['in', docstatuses(bill_type)]
+            },
+            fields=['name', 'bill_number', 'bill_type', 'creation', 'grand_total', 'date', 'payment_status', 'docstatus'],
+            order_by='creation desc',
+            start=start,
+            page_length=page_length
+        )
+
+    for key, voucher_type, petty_cash, toggle in VOUCHER_GROUPS if can_read_vouchers else []:
+        filters = {
+            'project': project,
+            'type': voucher_type,
+            'docstatus': ['in', docstatuses(toggle)]
+        }
+        if petty_cash is not None:
+            filters['petty_cash'] = petty_cash
+        summary['vouchers'][key] = frappe.get_list(
+            'Payment Voucher',
+            filters=filters,
+            fields=['name', 'date', 'payment_amount', 'docstatus'],
+            order_by='date desc',
+            start=start,
+            page_length=page_length
+        )
+
+    return summary
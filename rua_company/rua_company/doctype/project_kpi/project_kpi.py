@@ -0,0 +1,151 @@
+# Copyright (c) 2026, Yamen Zakhour and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt
+
+KPI_FIELDS = ["contract_value", "po_costs", "received", "paid", "petty_cash"]
+
+
+class ProjectKPI(Document):
+	pass
+
+def update_project_kpi(project, **deltas):
+	"""Apply incremental changes (e.g. received=500) to a project's KPI row
+
+	Called after the source document is written, so a missing row is built from
+	a full recomputation, which already includes the change. If another
+	transaction creates the row first, the change is applied to it instead.
+	"""
+	if not project:
+		return
+
+	deltas = {field: flt(value) for field, value in deltas.items()}
+	assignments = ", ".join(f"`{field}` = `{field}` + %({field})s" for field in deltas)
+
+	if frappe.db.exists("Project KPI", project):
+		frappe.db.sql(f"""
+			UPDATE `tabProject KPI`
+			SET {assignments}, outstanding = contract_value - received
+			WHERE name = %(project)s
+		""", {"project": project, **deltas})
+		return
+
+	kpi = get_project_kpis(project).get(project)
+	if kpi:
+		upsert_project_kpi(project, kpi, on_duplicate=assignments, values=deltas)
+
+def set_contract_value(project, contract_value):
+	"""Keep the KPI row in step with the project's contract value"""
+	if not frappe.db.exists("Project KPI", project):
+		reconcile_project_kpi(project)
+		return
+
+	frappe.db.sql("""
+		UPDATE `tabProject KPI`
+		SET contract_value = %(contract_value)s, outstanding = %(contract_value)s - received
+		WHERE name = %(project)s
+	""", {"project": project, "contract_value": flt(contract_value)})
+
+def get_project_kpis(project=None):
+	"""Compute KPIs from scratch with GROUP BY queries, for one or all projects"""
+	condition = "AND project = %(project)s" if project else ""
+	values = {"project": project}
+
+	kpis = {
+		row.name: dict({field: 0 for field in KPI_FIELDS}, contract_value=flt(row.contract_value))
+		for row in frappe.get_all(
+			"Project",
+			filters={"name": project} if project else None,
+			fields=["name", "contract_value"]
+		)
+	}
+
+	for row in frappe.db.sql(f"""
+		SELECT project, SUM(grand_total) AS total
+		FROM `tabBill`
+		WHERE docstatus = 1 AND bill_type = 'Purchase Order' {condition}
+		GROUP BY project
+	""", values, as_dict=True):
+		if row.project in kpis:
+			kpis[row.project]["po_costs"] = flt(row.total)
+
+	for row in frappe.db.sql(f"""
+		SELECT project, type, petty_cash, SUM(payment_amount) AS total
+		FROM `tabPayment Voucher`
+		WHERE docstatus = 1 {condition}
+		GROUP BY project, type, petty_cash
+	""", values, as_dict=True):
+		if row.project not in kpis:
+			continue
+		kpis[row.project][get_voucher_kpi_field(row.type, row.petty_cash)] += flt(row.total)
+
+	return kpis
+
+def get_voucher_kpi_field(voucher_type, petty_cash):
+	"""KPI field a Payment Voucher contributes to"""
+	if voucher_type == "Receive":
+		return "received"
+	return "petty_cash" if petty_cash else "paid"
+
+def reconcile_project_kpi(project=None):
+	"""Rebuild KPI rows from source documents, for one or all projects"""
+	for name, kpi in get_project_kpis(project).items():
+		upsert_project_kpi(
+			name, kpi,
+			on_duplicate=", ".join(f"`{field}` = VALUES(`{field}`)" for field in KPI_FIELDS)
+		)
+
+def upsert_project_kpi(project, kpi, on_duplicate, values=None):
+	"""Insert a KPI row, or run the `on_duplicate` assignments if it already exists
+
+	A single INSERT ... ON DUPLICATE KEY UPDATE, so concurrent first writes for a
+	project cannot fail with a duplicate entry.
+	"""
+	now = frappe.utils.now()
+	columns = ", ".join(f"`{field}`" for field in KPI_FIELDS)
+	placeholders = ", ".join(f"%(kpi_{field})s" for field in KPI_FIELDS)
+
+	frappe.db.sql(f"""
+		INSERT INTO `tabProject KPI`
+			(name, project, creation, modified, owner, modified_by, docstatus, idx,
+			 {columns}, outstanding)
+		VALUES (%(project)s, %(project)s, %(now)s, %(now)s, %(user)s, %(user)s, 0, 0,
+			{placeholders}, %(kpi_contract_value)s - %(kpi_received)s)
+		ON DUPLICATE KEY UPDATE {on_duplicate}, outstanding = contract_value - received
+	""", {
+		"project": project,
+		"now": now,
+		"user": frappe.session.user,
+		**{f"kpi_{field}": flt(kpi[field]) for field in KPI_FIELDS},
+		**(values or {})
+	})
+
+def reconcile_all_project_kpis():
+	"""Scheduled job: correct any drift of the incrementally maintained KPIs"""
+	reconcile_project_kpi()
+	frappe.db.commit()
+
+def handle_bill_submit(doc, method=None):
+	if doc.bill_type == "Purchase Order":
+		update_project_kpi(doc.project, po_costs=doc.grand_total)
+
+def handle_bill_cancel(doc, method=None):
+	if doc.bill_type == "Purchase Order":
+		update_project_kpi(doc.project, po_costs=-flt(doc.grand_total))
+
+def handle_payment_voucher_submit(doc, method=None):
+	field = get_voucher_kpi_field(doc.type, doc.petty_cash)
+	update_project_kpi(doc.project, **{field: doc.payment_amount})
+
+def handle_payment_voucher_cancel(doc, method=None):
+	field = get_voucher_kpi_field(doc.type, doc.petty_cash)
+	update_project_kpi(doc.project, **{field: -flt(doc.payment_amount)})
+
+def handle_project_update(doc, method=None):
+	if doc.has_value_changed("contract_value") or not frappe.db.exists("Project KPI", doc.name):
+		set_contract_value(doc.name, doc.contract_value)
+
+def handle_project_trash(doc, method=None):
+	frappe.db.delete("Project KPI", {"project": doc.name})
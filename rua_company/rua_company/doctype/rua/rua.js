@@ -64,12 +64,34 @@ function show_vat_report_dialog(frm) {
                 label: __('Include parties with no TRN'),
                 fieldtype: 'Check',
                 default: 1
+            },
+            {
+                fieldname: 'export_format',
+                label: __('Export Format'),
+                fieldtype: 'Select',
+                options: 'csv\nndjson',
+                default: 'csv',
+                description: __('Used by Export Data: raw voucher rows without styling')
             }
         ],
         primary_action_label: __('Generate'),
         primary_action(values) {
             generate_vat_report(frm, values.from_date, values.to_date, values.include_no_trn);
             dialog.hide();
+        },
+        secondary_action_label: __('Export Data'),
+        secondary_action() {
+            const values = dialog.get_values();
+            if (!values) return;
+
+            // Streamed download, the browser saves it as it arrives
+            window.open('/api/method/rua_company.rua_company.doctype.rua.rua.export_vat_data?' + $.param({
+                from_date: values.from_date,
+                to_date: values.to_date,
+                include_no_trn: values.include_no_trn,
+                export_format: values.export_format
+            }));
+            dialog.hide();
         }
     });
 
@@ -116,34 +138,79 @@ function generate_vat_report(frm, from_date, to_date, include_no_trn) {
         args: {
             from_date: from_date,
             to_date: to_date,
-            include_no_trn: include_no_trn
+            include_no_trn: include_no_trn,
+            run_async: 1
         },
+        // Small periods are built within this call, large ones return once queued
+        freeze: true,
+        freeze_message: __('Generating VAT Report...'),
         callback: function(r) {
-            if (!r.exc) {
-                // Convert base64 to Blob
-                const binary = atob(r.message.file_content);
-                const array = new Uint8Array(binary.length);
-                for (let i = 0; i < binary.length; i++) {
-                    array[i] = binary.charCodeAt(i);
-                }
-                const blob = new Blob([array], { type: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' });
-
-                // Create download link
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.style.display = 'none';
-                a.href = url;
-                a.download = r.message.file_name;
-                
-                document.body.appendChild(a);
-                a.click();
-                
-                // Cleanup
-                window.URL.revokeObjectURL(url);
-                document.body.removeChild(a);
+            if (r.exc) return;
+
+            if (r.message.file_url) {
+                // Same period was generated before
+                download_report(r.message);
+            } else {
+                track_report_progress(r.message.key);
             }
-        },
-        freeze: true,
-        freeze_message: __('Generating VAT Report...')
+        }
+    });
+}
+
+function track_report_progress(key) {
+    const title = __('Generating VAT Report');
+    frappe.show_progress(title, 0, 1, __('Queued'));
+
+    let finished = false;
+    const finish = function(report, error) {
+        if (finished) return;
+        finished = true;
+        frappe.realtime.off('vat_report_progress', handler);
+        frappe.hide_progress();
+
+        if (error) {
+            frappe.msgprint({
+                title: __('VAT Report Failed'),
+                message: error,
+                indicator: 'red'
+            });
+        } else {
+            download_report(report);
+        }
+    };
+
+    const handler = function(data) {
+        if (data.key !== key || finished) return;
+
+        if (data.error || data.report) {
+            finish(data.report, data.error);
+            return;
+        }
+
+        frappe.show_progress(title, data.progress, data.total, __(data.label));
+    };
+
+    frappe.realtime.on('vat_report_progress', handler);
+
+    // The job may have finished before we subscribed, so check once we are listening
+    frappe.call({
+        method: 'rua_company.rua_company.doctype.rua.rua.get_vat_report_status',
+        args: { key: key },
+        callback: function(r) {
+            if (r.exc || !r.message || r.message.queued) return;
+            finish(r.message.report, r.message.error);
+        }
     });
 }
+
+function download_report(report) {
+    // The workbook is stored as a private file; the browser fetches it directly
+    const a = document.createElement('a');
+    a.style.display = 'none';
+    a.href = report.file_url;
+    a.download = report.file_name;
+
+    document.body.appendChild(a);
+    a.click();
+    document.body.removeChild(a);
+}
@@ -2,227 +2,198 @@
 # For license information, please see license.txt
 
 import frappe
+from frappe import _
 from frappe.model.document import Document
+from werkzeug.wrappers import Response
 import openpyxl
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, PatternFill, Border, Side, NamedStyle
 from openpyxl.drawing.image import Image
-from frappe.utils import get_site_base_path, get_files_path
-import os
+from frappe.utils import get_site_base_path, cint, flt, getdate, get_first_day, get_last_day, add_days, now_datetime
+from frappe.utils.background_jobs import is_job_enqueued
+from rua_company.rua_company.doctype.vat_ledger.vat_ledger import VAT_CATEGORY_SQL, get_vat_ledger_version
+from rua_company.utils.branding import get_branding
 from datetime import datetime
-import base64
-from PIL import Image as PILImage
+from itertools import groupby
+import csv
 import io
+import json
 
 class Rua(Document):
-    pass
+    def on_update(self):
+        # Ledger rows store base and tax split with the VAT rate
+        if self.has_value_changed('vat'):
+            frappe.enqueue(
+                'rua_company.rua_company.doctype.vat_ledger.vat_ledger.reconcile_vat_ledger',
+                queue='long',
+                job_id='vat_ledger_rebuild',
+                deduplicate=True,
+                enqueue_after_commit=True
+            )
 
 def get_company_info():
     """Get company information from Rua settings"""
-    return frappe.db.get_singles_dict('Rua')
-
-def define_styles():
-    """Define consistent styles for the workbook"""
-    styles = {
-        'header': {
-            'font': Font(name='Calibri', size=12, bold=True, color='FFFFFF'),
-            'fill': PatternFill(start_color='2C3E50', end_color='2C3E50', fill_type='solid'),
-            'alignment': Alignment(horizontal='center', vertical='center', wrap_text=True),
-            'border': Border(
-                left=Side(style='thin', color='FFFFFF'),
-                right=Side(style='thin', color='FFFFFF'),
-                top=Side(style='thin', color='FFFFFF'),
-                bottom=Side(style='thin', color='FFFFFF')
-            )
-        },
-        'subheader': {
-            'font': Font(name='Calibri', size=11, bold=True, color='2C3E50'),
-            'fill': PatternFill(start_color='ECF0F1', end_color='ECF0F1', fill_type='solid'),
-            'alignment': Alignment(horizontal='center', vertical='center'),
-            'border': Border(
-                left=Side(style='thin', color='B3B3B3'),
-                right=Side(style='thin', color='B3B3B3'),
-                top=Side(style='thin', color='B3B3B3'),
-                bottom=Side(style='thin', color='B3B3B3')
-            )
-        },
-        'data': {
-            'font': Font(name='Calibri', size=10),
-            'fill': PatternFill(start_color='FFFFFF', end_color='FFFFFF', fill_type='solid'),  # Added fill
-            'alignment': Alignment(vertical='center'),
-            'border': Border(
-                left=Side(style='thin', color='E5E5E5'),
-                right=Side(style='thin', color='E5E5E5'),
-                top=Side(style='thin', color='E5E5E5'),
-                bottom=Side(style='thin', color='E5E5E5')
-            )
-        },
-        'total': {
-            'font': Font(name='Calibri', size=11, bold=True, color='2C3E50'),
-            'fill': PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid'),
-            'border': Border(
-                left=Side(style='thin', color='B3B3B3'),
-                right=Side(style='thin', color='B3B3B3'),
-                top=Side(style='thin', color='B3B3B3'),
-                bottom=Side(style='double', color='B3B3B3')
-            )
-        }
+    return get_branding()['company_info']
+
+VOUCHER_SHEET_COLUMNS = {
+    'A': 8,   # S.No
+    'B': 15,  # Date
+    'C': 15,  # Voucher
+    'D': 25,  # Names
+    'E': 25,  # TRN
+    'F': 15,  # Amount
+    'G': 15,  # Tax
+    'H': 15,  # Total
+    'I': 12   # Emirate
+}
+
+# Named style of each detail sheet column; striped rows use the "_striped" variant
+VOUCHER_ROW_STYLES = [
+    'vat_row_index', 'vat_row_date', 'vat_row_text', 'vat_row_text', 'vat_row_code',
+    'vat_row_amount', 'vat_row_amount', 'vat_row_amount', 'vat_row_code'
+]
+
+AMOUNT_FORMAT = '"AED "#,##0.00'
+
+def register_styles(wb, brand_color):
+    """Register the workbook's named styles once, so cells only reference them by name"""
+    def thin(color):
+        return Side(style='thin', color=color)
+
+    brand_fill = PatternFill(start_color=brand_color, end_color=brand_color, fill_type='solid')
+    stripe_fill = PatternFill(start_color='F9FAFB', end_color='F9FAFB', fill_type='solid')
+
+    styles = [
+        # Branding header
+        NamedStyle('vat_brand_fill', fill=brand_fill),
+        NamedStyle('vat_company_name', font=Font(name='Calibri', size=18, bold=True, color=brand_color),
+                   alignment=Alignment(horizontal='left', vertical='center', indent=1)),
+        NamedStyle('vat_report_title', font=Font(name='Calibri', size=14, bold=True, color='2C3E50'),
+                   alignment=Alignment(horizontal='left', vertical='center', indent=1)),
+        NamedStyle('vat_meta', font=Font(name='Calibri', size=11, color='666666'),
+                   alignment=Alignment(horizontal='right', vertical='center')),
+        # Detail tables
+        NamedStyle('vat_table_header', font=Font(name='Calibri', size=11, bold=True, color='2C3E50'),
+                   fill=PatternFill(start_color='F5F7FA', end_color='F5F7FA', fill_type='solid'),
+                   border=Border(bottom=thin('E5E5E5'), top=thin('E5E5E5')),
+                   alignment=Alignment(horizontal='center', vertical='center', wrap_text=True)),
+        NamedStyle('vat_total', font=Font(name='Calibri', size=11, bold=True, color='2C3E50'),
+                   fill=PatternFill(start_color='FFF2CC', end_color='FFF2CC', fill_type='solid'),
+                   border=Border(left=thin('B3B3B3'), right=thin('B3B3B3'), top=thin('B3B3B3'),
+                                 bottom=Side(style='double', color='B3B3B3'))),
+        # Summary tables
+        NamedStyle('vat_summary_header', font=Font(name='Calibri', size=12, bold=True, color='FFFFFF'),
+                   fill=PatternFill(start_color='2C3E50', end_color='2C3E50', fill_type='solid'),
+                   alignment=Alignment(horizontal='center', vertical='center', wrap_text=True),
+                   border=Border(left=thin('FFFFFF'), right=thin('FFFFFF'), top=thin('FFFFFF'), bottom=thin('FFFFFF'))),
+        NamedStyle('vat_section_title', font=Font(name='Calibri', size=12, bold=True, color='2C3E50')),
+        NamedStyle('vat_final_title', font=Font(name='Calibri', size=14, bold=True, color='2C3E50'),
+                   alignment=Alignment(horizontal='center')),
+        NamedStyle('vat_final_label', font=Font(name='Calibri', size=11, bold=True)),
+        NamedStyle('vat_final_value', font=Font(name='Calibri', size=11, bold=True),
+                   number_format=AMOUNT_FORMAT, alignment=Alignment(horizontal='right')),
+        NamedStyle('vat_party', alignment=Alignment(horizontal='left')),
+        NamedStyle('vat_party_trn', alignment=Alignment(horizontal='center')),
+        NamedStyle('vat_party_amount', number_format=AMOUNT_FORMAT, alignment=Alignment(horizontal='right'))
+    ]
+
+    # Totals rows: detail sheets use a plain number format, the summary the AED one
+    total = styles[5]
+    styles.append(NamedStyle('vat_total_amount', font=total.font, fill=total.fill, border=total.border,
+                             number_format='#,##0.00', alignment=Alignment(horizontal='right', vertical='center')))
+    styles.append(NamedStyle('vat_total_summary', font=total.font, fill=total.fill, border=total.border,
+                             number_format=AMOUNT_FORMAT, alignment=Alignment(horizontal='right')))
+
+    # Detail rows, plain and striped
+    row_formats = {
+        'vat_row_index': ('center', '0'),
+        'vat_row_date': ('center', 'DD/MM/YYYY'),
+        'vat_row_text': ('left', 'General'),
+        'vat_row_code': ('center', 'General'),
+        'vat_row_amount': ('right', AMOUNT_FORMAT)
     }
-    return styles
+    for name, (align, number_format) in row_formats.items():
+        for suffix, fill in (('', None), ('_striped', stripe_fill)):
+            style = NamedStyle(name + suffix, font=Font(name='Calibri', size=10, color='2C3E50'),
+                               border=Border(bottom=thin('E5E5E5')),
+                               alignment=Alignment(horizontal=align, vertical='center'),
+                               number_format=number_format)
+            if fill:
+                style.fill = fill
+            styles.append(style)
+
+    for style in styles:
+        wb.add_named_style(style)
+
+class StreamingSheet:
+    """Write-only worksheet that keeps track of the current row
 
-def apply_modern_branding(ws, company_info, report_title, from_date, to_date):
+    Rows can only be appended in write-only mode, so merges and row heights are
+    registered against the row number tracked here.
+    """
+    def __init__(self, wb, title, column_widths):
+        self.ws = wb.create_sheet(title=title)
+        for col, width in column_widths.items():
+            self.ws.column_dimensions[col].width = width
+        self.row = 0
+
+    def append(self, cells=(), height=None, merge=None):
+        """Append a row of values or (value, style name) tuples and return its number
+
+        `merge` is a (first column, last column) pair of letters.
+        """
+        self.row += 1
+        if height:
+            self.ws.row_dimensions[self.row].height = height
+        if merge:
+            self.ws.merged_cells.add(f'{merge[0]}{self.row}:{merge[1]}{self.row}')
+        self.ws.append([self.cell(cell) for cell in cells])
+        return self.row
+
+    def cell(self, cell):
+        if not isinstance(cell, tuple):
+            return cell
+        value, style = cell
+        cell = WriteOnlyCell(self.ws, value=value)
+        if style:
+            cell.style = style
+        return cell
+
+def apply_modern_branding(sheet, branding, report_title, from_date, to_date):
     """Apply clean, modern branding with full-width header"""
-    # Get brand color with fallback
-    brand_color = company_info.get('brand_color', '#2C3E50').lstrip('#')
-    
-    # Set column widths
-    column_widths = {
-        'A': 8,   # S.No
-        'B': 15,  # Date
-        'C': 15,  # Voucher
-        'D': 25,  # Names
-        'E': 25,  # TRN
-        'F': 15,  # Amount
-        'G': 15,  # Tax
-        'H': 15,  # Total
-        'I': 12   # Emirate
-    }
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
+    company_info = branding['company_info']
+    brand = ('', 'vat_brand_fill')
 
-    current_row = 1
-    
     # Logo Row
     if company_info.get('logo_horizontal'):
-        logo_path = frappe.get_site_path('public', company_info.logo_horizontal.lstrip('/'))
-        if os.path.exists(logo_path):
-            with PILImage.open(logo_path) as img:
-                img = img.convert('RGB')
-                max_height = 45  # pixels
-                aspect_ratio = img.width / img.height
-                new_width = int(max_height * aspect_ratio)
-                img = img.resize((new_width, max_height))
-                
-                img_bytes = io.BytesIO()
-                img.save(img_bytes, format='PNG')
-                img_bytes.seek(0)
-                
-                logo = Image(img_bytes)
-                logo.width = new_width
-                logo.height = max_height
-                ws.add_image(logo, 'A1')
-        
-        # Merge cells C to I and set background color
-        ws.merge_cells(f'C{current_row}:I{current_row}')
-        for col in range(3, 10):  # C through I (3 to 9 in openpyxl)
-            cell = ws.cell(row=current_row, column=col)
-            cell.fill = PatternFill(start_color=brand_color, end_color=brand_color, fill_type='solid')
-                
-        ws.row_dimensions[current_row].height = 40
-        current_row += 1
-
-    # Company Name - Large and prominent
-    ws.row_dimensions[current_row].height = 35
-    company_cell = ws.cell(row=current_row, column=1)  # Start from column A
-    company_cell.value = company_info.get('company_name', '')
-    company_cell.font = Font(name='Calibri', size=18, bold=True, color=brand_color)
-    company_cell.alignment = Alignment(horizontal='left', vertical='center', indent=1)
-    
-    # TRN/VAT info - Right aligned in the same row
-    trn_cell = ws.cell(row=current_row, column=9)  # Adjusted column for better spacing
-    trn_cell.value = f"TRN: {company_info.get('trn', '')}  |  VAT: {company_info.get('vat', '5')}%"
-    trn_cell.font = Font(name='Calibri', size=11, color='666666')
-    trn_cell.alignment = Alignment(horizontal='right', vertical='center')
-    current_row += 1
+        if branding['logo']:
+            logo = Image(io.BytesIO(branding['logo']['content']))
+            logo.width = branding['logo']['width']
+            logo.height = branding['logo']['height']
+            sheet.ws.add_image(logo, 'A1')
+
+        # Cells C to I merged with the brand color as background
+        sheet.append([None, None] + [brand] * 7, height=40, merge=('C', 'I'))
+
+    # Company Name - Large and prominent, TRN/VAT info right aligned in the same row
+    sheet.append(
+        [(company_info.get('company_name', ''), 'vat_company_name')] + [None] * 7
+        + [(f"TRN: {company_info.get('trn', '')}  |  VAT: {company_info.get('vat', '5')}%", 'vat_meta')],
+        height=35
+    )
 
     # Separator line with brand color
-    ws.row_dimensions[current_row].height = 4
-    for col in range(1, 10):  # A through I
-        cell = ws.cell(row=current_row, column=col)
-        cell.fill = PatternFill(start_color=brand_color, end_color=brand_color, fill_type='solid')
-    current_row += 1
+    sheet.append([brand] * 9, height=4)
 
     # Report Title and Date Range
-    ws.row_dimensions[current_row].height = 30
-    
-    # Report Title - Left aligned
-    title_cell = ws.cell(row=current_row, column=1)  # Start from column A
-    title_cell.value = report_title
-    title_cell.font = Font(name='Calibri', size=14, bold=True, color='2C3E50')
-    title_cell.alignment = Alignment(horizontal='left', vertical='center', indent=1)
-    
-    # Date Range - Right aligned
-    date_cell = ws.cell(row=current_row, column=9)  # Adjusted column for better spacing
-    date_cell.value = f"Period: {from_date} to {to_date}"
-    date_cell.font = Font(name='Calibri', size=11, color='666666')
-    date_cell.alignment = Alignment(horizontal='right', vertical='center')
-    
-    current_row += 2  # Add space before table headers
-    
-    return current_row
-
-def style_modern_table(ws, start_row, headers, styles):
-    """Style table headers with a clean, modern look"""
-    ws.row_dimensions[start_row].height = 30
-    
-    header_font = Font(name='Calibri', size=11, bold=True, color='2C3E50')
-    header_fill = PatternFill(start_color='F5F7FA', end_color='F5F7FA', fill_type='solid')
-    header_border = Border(
-        bottom=Side(style='thin', color='E5E5E5'),
-        top=Side(style='thin', color='E5E5E5')
+    sheet.append(
+        [(report_title, 'vat_report_title')] + [None] * 7
+        + [(f"Period: {from_date} to {to_date}", 'vat_meta')],
+        height=30
     )
-    
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=start_row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = header_border
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    
-    return start_row + 1
 
-def apply_row_styling(ws, row, data, styles, is_striped=True):
-    """Apply modern row styling with subtle stripes"""
-    stripe_fill = PatternFill(start_color='F9FAFB', end_color='F9FAFB', fill_type='solid')
-    
-    for col, (value, align) in enumerate(data, 1):
-        cell = ws.cell(row=row, column=col, value=value)
-        
-        # Apply base styles
-        cell.font = Font(name='Calibri', size=10, color='2C3E50')
-        cell.border = Border(
-            bottom=Side(style='thin', color='E5E5E5')
-        )
-        
-        # Apply stripe pattern
-        if is_striped and row % 2 == 0:
-            cell.fill = stripe_fill
-            
-        # Set alignment
-        cell.alignment = Alignment(horizontal=align, vertical='center')
-        
-        # Format based on column type
-        if col == 1:  # S.No
-            cell.number_format = '0'
-        elif col == 2:  # Date
-            cell.number_format = 'DD/MM/YYYY'
-        elif col in [6, 7, 8]:  # Payment Amount, Tax Amount, Total Amount
-            cell.number_format = '"AED "#,##0.00'
-        
-        # Format numbers
-        if isinstance(value, (int, float)):
-            pass
-
-def apply_style(cell, style):
-    """Apply a predefined style to a cell"""
-    # Apply each style property if it exists
-    if 'font' in style:
-        cell.font = style['font']
-    if 'fill' in style:
-        cell.fill = style['fill']
-    if 'alignment' in style:
-        cell.alignment = style['alignment']
-    if 'border' in style:
-        cell.border = style['border']
+    # Space before table headers
+    sheet.append()
 
 def adjust_color_brightness(hex_color, factor):
     """Adjust the brightness of a hex color"""
@@ -230,399 +201,403 @@ def adjust_color_brightness(hex_color, factor):
     new_rgb = tuple(min(255, int(c * factor)) for c in rgb)
     return '%02x%02x%02x' % new_rgb
 
-def get_filtered_vouchers(doctype, filters, include_no_trn):
-    """Get vouchers filtered by TRN if needed"""
-    vouchers = frappe.get_all(
-        doctype,
-        filters=filters,
-        fields=["name", "date", "party", "amount", "trn", "emirate"]
-    )
-    
-    if not int(include_no_trn):
-        vouchers = [v for v in vouchers if v.trn not in [None, "", "0"]]
-    
-    return vouchers
+# (category, sheet title, report title, party column label), in sheet order
+VAT_CATEGORIES = [
+    ('supplier', "Supplier", "Supplier VAT Report", "Supplier"),
+    ('customer', "Customer", "Customer VAT Report", "Customer"),
+    ('petty_cash', "Petty Cash", "Petty Cash VAT Report", "Party")
+]
+
+def get_vat_conditions(include_no_trn):
+    """WHERE clause shared by the detail and summary queries"""
+    conditions = "pv.docstatus = 1 AND pv.date BETWEEN %(from_date)s AND %(to_date)s"
+    if not cint(include_no_trn):
+        conditions += " AND IFNULL(p.trn, '') NOT IN ('', '0')"
+    return conditions
+
+def get_vat_vouchers(from_date, to_date, include_no_trn):
+    """Iterate over every voucher of the period in one query
+
+    Rows come in VAT_CATEGORIES order: suppliers, customers, then petty cash.
+    """
+    return frappe.db.sql(f"""
+        SELECT
+            {VAT_CATEGORY_SQL} AS category,
+            pv.name, pv.date, pv.party, pv.payment_amount AS amount,
+            p.trn, p.emirate
+        FROM `tabPayment Voucher` pv
+        LEFT JOIN `tabParty` p ON p.name = pv.party
+        WHERE {get_vat_conditions(include_no_trn)}
+        ORDER BY pv.petty_cash, pv.type != 'Pay', pv.date, pv.name
+    """, {'from_date': from_date, 'to_date': to_date}, as_dict=True, as_iterator=True)
+
+def get_vat_party_totals(from_date, to_date, vat_percentage, include_no_trn):
+    """Base, tax and total per (category, party)
+
+    Periods made of whole months are read from the pre-aggregated VAT Ledger;
+    anything else is aggregated from Payment Voucher in SQL.
+    """
+    if covers_whole_months(from_date, to_date):
+        rows = get_ledger_party_totals(from_date, to_date, include_no_trn)
+    else:
+        rows = frappe.db.sql(f"""
+            SELECT
+                {VAT_CATEGORY_SQL} AS category,
+                pv.party, MAX(p.trn) AS trn,
+                SUM(pv.payment_amount) / %(vat_factor)s AS base,
+                SUM(pv.payment_amount) - SUM(pv.payment_amount) / %(vat_factor)s AS tax,
+                SUM(pv.payment_amount) AS total
+            FROM `tabPayment Voucher` pv
+            LEFT JOIN `tabParty` p ON p.name = pv.party
+            WHERE {get_vat_conditions(include_no_trn)}
+            GROUP BY category, pv.party
+            ORDER BY category, pv.party
+        """, {
+            'from_date': from_date,
+            'to_date': to_date,
+            'vat_factor': 1 + (vat_percentage / 100)
+        }, as_dict=True)
+
+    totals = {category: [] for category, *_ in VAT_CATEGORIES}
+    for row in rows:
+        totals[row.category].append(row)
+    return totals
+
+def covers_whole_months(from_date, to_date):
+    from_date, to_date = getdate(from_date), getdate(to_date)
+    return from_date == get_first_day(from_date) and to_date == get_last_day(to_date)
+
+def get_ledger_party_totals(from_date, to_date, include_no_trn):
+    """Sum the monthly VAT Ledger rows of the period per (category, party)"""
+    trn_condition = "" if cint(include_no_trn) else "AND IFNULL(p.trn, '') NOT IN ('', '0')"
+    return frappe.db.sql(f"""
+        SELECT
+            l.category, l.party, MAX(p.trn) AS trn,
+            SUM(l.base) AS base, SUM(l.tax) AS tax, SUM(l.total) AS total
+        FROM `tabVAT Ledger` l
+        LEFT JOIN `tabParty` p ON p.name = l.party
+        WHERE l.month BETWEEN %(from_date)s AND %(to_date)s {trn_condition}
+        GROUP BY l.category, l.party
+        HAVING SUM(l.vouchers) > 0
+        ORDER BY l.category, l.party
+    """, {'from_date': from_date, 'to_date': to_date}, as_dict=True)
+
+VAT_REPORT_CACHE_TTL = 7 * 24 * 60 * 60  # generated files are deleted after a week
+VAT_REPORT_SYNC_LIMIT = 5000  # vouchers few enough to build within the request
 
 @frappe.whitelist()
-def generate_vat_report(from_date, to_date, include_no_trn=1):
-    """Generate VAT report with enhanced styling"""
-    company_info = get_company_info()
-    vat_percentage = float(company_info.get('vat', '5'))
-    styles = define_styles()
-    
-    wb = openpyxl.Workbook()
-    generate_supplier_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn)
-    generate_customer_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn)
-    generate_petty_cash_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn)
-    generate_summary_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn)
-    
-    # Save to temporary file
-    file_name = f'VAT_Report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
-    temp_file_path = os.path.join(get_files_path(), file_name)
-    wb.save(temp_file_path)
-    
-    # Read and encode file
-    with open(temp_file_path, 'rb') as f:
-        file_content = f.read()
-    
-    # Clean up and return
-    os.remove(temp_file_path)
-    return {
+def generate_vat_report(from_date, to_date, include_no_trn=1, run_async=0):
+    """Generate VAT report with enhanced styling
+
+    Reports are cached per period, TRN filter, ledger version and party data. With
+    `run_async`, periods of more than VAT_REPORT_SYNC_LIMIT vouchers are built on
+    the long queue, reporting progress through `vat_report_progress` realtime
+    events on the Rua form; smaller ones are still built right away.
+    """
+    key = get_vat_report_key(from_date, to_date, include_no_trn)
+    report = get_cached_vat_report(key)
+    if report:
+        return report
+
+    if cint(run_async) and count_vat_vouchers(from_date, to_date, include_no_trn) > VAT_REPORT_SYNC_LIMIT:
+        frappe.enqueue(
+            build_vat_report,
+            queue='long',
+            timeout=3600,
+            job_id=f'vat_report::{key}',
+            deduplicate=True,
+            key=key,
+            from_date=from_date,
+            to_date=to_date,
+            include_no_trn=include_no_trn
+        )
+        return {'key': key, 'queued': 1}
+
+    return build_vat_report(key, from_date, to_date, include_no_trn)
+
+def get_vat_report_key(from_date, to_date, include_no_trn):
+    """Cache key of a report; changes whenever vouchers, parties or branding change"""
+    # TRNs, emirates and the TRN filter all come from Party
+    parties_modified = frappe.db.sql('SELECT MAX(modified) FROM `tabParty`')[0][0]
+    return '::'.join([
+        str(getdate(from_date)),
+        str(getdate(to_date)),
+        str(cint(include_no_trn)),
+        get_vat_ledger_version(),
+        str(frappe.db.get_value('Rua', 'Rua', 'modified')),
+        str(parties_modified)
+    ])
+
+def get_cached_vat_report(key):
+    report = frappe.cache.get_value(f'vat_report::{key}')
+    if report and frappe.db.exists('File', {'file_url': report['file_url']}):
+        return report
+
+@frappe.whitelist()
+def get_vat_report_status(key):
+    """State of a queued report, for clients that may have missed its progress events"""
+    # Checked before the cache, so a job finishing in between is still seen as done
+    queued = is_job_enqueued(f'vat_report::{key}')
+    report = get_cached_vat_report(key)
+    if report:
+        return {'report': report}
+    if queued:
+        return {'queued': 1}
+    return {'error': _("The VAT report could not be generated. Please try again.")}
+
+def count_vat_vouchers(from_date, to_date, include_no_trn):
+    return frappe.db.sql(f"""
+        SELECT COUNT(*)
+        FROM `tabPayment Voucher` pv
+        LEFT JOIN `tabParty` p ON p.name = pv.party
+        WHERE {get_vat_conditions(include_no_trn)}
+    """, {'from_date': from_date, 'to_date': to_date})[0][0]
+
+def build_vat_report(key, from_date, to_date, include_no_trn):
+    """Build the workbook, store it as a private file and cache the handle"""
+    steps = len(VAT_CATEGORIES) + 2
+
+    def publish_progress(step, label, **extra):
+        frappe.publish_realtime(
+            'vat_report_progress',
+            dict(key=key, progress=step, total=steps, label=label, **extra),
+            doctype='Rua',
+            docname='Rua'
+        )
+
+    try:
+        branding = get_branding()
+        vat_percentage = float(branding['company_info'].get('vat', '5'))
+
+        # Write-only workbooks stream rows to disk instead of keeping every cell in memory
+        wb = openpyxl.Workbook(write_only=True)
+        register_styles(wb, branding['brand_color'])
+
+        # Detail sheets consume the ordered voucher query one category at a time.
+        # Nothing else may query the database until it is exhausted.
+        vouchers = groupby(get_vat_vouchers(from_date, to_date, include_no_trn), key=lambda pv: pv.category)
+        group = next(vouchers, None)
+        for step, (category, title, report_title, party_label) in enumerate(VAT_CATEGORIES, 1):
+            rows = group[1] if group and group[0] == category else []
+            generate_voucher_sheet(wb, title, report_title, party_label, rows,
+                                   from_date, to_date, vat_percentage, branding)
+            if rows:
+                group = next(vouchers, None)
+            publish_progress(step, title)
+
+        generate_summary_sheet(wb, from_date, to_date, vat_percentage, branding, include_no_trn)
+        publish_progress(steps - 1, "Summary")
+
+        report = save_report_file(wb, f'VAT_Report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
+    except Exception as e:
+        publish_progress(0, "Failed", error=str(e))
+        raise
+
+    frappe.cache.set_value(f'vat_report::{key}', report, expires_in_sec=VAT_REPORT_CACHE_TTL)
+    publish_progress(steps, "Done", report=report)
+    return report
+
+def save_report_file(wb, file_name):
+    """Save a workbook as a private File and return a handle for downloading it"""
+    buffer = io.BytesIO()
+    wb.save(buffer)
+
+    file_doc = frappe.get_doc({
+        'doctype': 'File',
         'file_name': file_name,
-        'file_content': base64.b64encode(file_content).decode('utf-8')
+        'attached_to_doctype': 'Rua',
+        'attached_to_name': 'Rua',
+        'is_private': 1,
+        'content': buffer.getvalue()
+    })
+    file_doc.save(ignore_permissions=True)
+
+    return {
+        'file_name': file_doc.file_name,
+        'file_url': file_doc.file_url
     }
 
-def generate_supplier_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn):
-    """Generate supplier sheet with enhanced styling"""
-    ws = wb.active
-    ws.title = "Supplier"
-    
-    headers = ['S. No.', 'Payment Date', 'Voucher Number', 'Supplier Name', 'Supplier TRN',
-               'Payment Amount', 'Tax Amount', 'Total Amount', 'Emirate']
-    
-    # Apply branding and get starting row
-    start_row = apply_modern_branding(ws, company_info, "Supplier VAT Report", from_date, to_date)
-    
-    # Style table and get data starting row
-    data_start_row = style_modern_table(ws, start_row, headers, styles)
-    
-    # Get payment vouchers
-    payment_vouchers = get_filtered_vouchers(
-        "Payment Voucher",
-        {
-            "type": "Pay",
-            "date": ["between", [from_date, to_date]],
-            "docstatus": 1,
-            "is_petty_cash": 0
-        },
-        include_no_trn
+VAT_EXPORT_COLUMNS = ['category', 'date', 'voucher', 'party', 'trn', 'emirate', 'base', 'tax', 'total']
+VAT_EXPORT_CHUNK_SIZE = 1000
+
+@frappe.whitelist()
+def export_vat_data(from_date, to_date, include_no_trn=1, export_format='csv'):
+    """Stream the period's vouchers with computed base and tax as CSV or NDJSON
+
+    Rows are read through an unbuffered (server-side) cursor and sent in
+    chunks, so memory use does not depend on the size of the period.
+    """
+    frappe.has_permission('Payment Voucher', 'read', throw=True)
+    if export_format not in ('csv', 'ndjson'):
+        frappe.throw(_("Format must be csv or ndjson"))
+
+    site, sites_path, user = frappe.local.site, frappe.local.sites_path, frappe.session.user
+    vat_factor = 1 + float(get_branding()['company_info'].get('vat', '5')) / 100
+
+    def stream():
+        # The request context is torn down before the body is sent,
+        # so the generator needs its own connection
+        frappe.init(site=site, sites_path=sites_path)
+        frappe.connect()
+        frappe.set_user(user)
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if export_format == 'csv':
+                writer.writerow(VAT_EXPORT_COLUMNS)
+
+            with frappe.db.unbuffered_cursor():
+                for count, pv in enumerate(get_vat_vouchers(from_date, to_date, include_no_trn), 1):
+                    amount = flt(pv.amount)
+                    base_amount = amount / vat_factor
+                    row = [
+                        pv.category, str(pv.date), pv.name, pv.party, pv.trn or '', pv.emirate or '',
+                        round(base_amount, 2), round(amount - base_amount, 2), amount
+                    ]
+                    if export_format == 'csv':
+                        writer.writerow(row)
+                    else:
+                        buffer.write(json.dumps(dict(zip(VAT_EXPORT_COLUMNS, row))) + '\n')
+
+                    if count % VAT_EXPORT_CHUNK_SIZE == 0:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+
+            yield buffer.getvalue()
+        finally:
+            frappe.destroy()
+
+    file_name = f'VAT_Data_{getdate(from_date)}_{getdate(to_date)}.{export_format}'
+    return Response(
+        stream(),
+        mimetype='text/csv' if export_format == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{file_name}"'},
+        direct_passthrough=True
     )
-    
-    # Fill data
-    row = data_start_row
-    for idx, pv in enumerate(payment_vouchers, 1):
-        amount = float(pv.amount)
-        base_amount = amount / (1 + (vat_percentage / 100))
-        tax_amount = amount - base_amount
-        
-        data = [
-            (idx, 'center'),
-            (pv.date, 'center'),
-            (pv.name, 'left'),
-            (pv.party, 'left'),
-            (pv.trn, 'center'),
-            (round(base_amount, 2), 'right'),
-            (round(tax_amount, 2), 'right'),
-            (amount, 'right'),
-            (pv.emirate, 'center')
-        ]
-        
-        apply_row_styling(ws, row, data, styles)
-        row += 1
-    
-    # Add totals
-    if payment_vouchers:
-        row += 1
-        total_base = sum(float(pv.amount) / (1 + (vat_percentage / 100)) for pv in payment_vouchers)
-        total_tax = sum(float(pv.amount) - (float(pv.amount) / (1 + (vat_percentage / 100))) for pv in payment_vouchers)
-        total_amount = sum(float(pv.amount) for pv in payment_vouchers)
-        
-        # Merge cells for total label
-        ws.merge_cells(f'A{row}:E{row}')
-        total_label = ws.cell(row=row, column=1, value="Totals")
-        apply_style(total_label, styles['total'])
-        
-        # Add total amounts
-        for value, col in [
-            (round(total_base, 2), 6),
-            (round(total_tax, 2), 7),
-            (total_amount, 8)
-        ]:
-            cell = ws.cell(row=row, column=col, value=value)
-            apply_style(cell, styles['total'])
-            cell.number_format = '#,##0.00'
-            cell.alignment = Alignment(horizontal='right', vertical='center')
-
-def generate_customer_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn):
-    """Generate customer sheet with enhanced styling"""
-    ws = wb.create_sheet(title="Customer")
-    
-    headers = ['S. No.', 'Payment Date', 'Voucher Number', 'Customer Name', 'Customer TRN',
-               'Payment Amount', 'Tax Amount', 'Total Amount', 'Emirate']
-    
-    # Apply branding and get starting row
-    start_row = apply_modern_branding(ws, company_info, "Customer VAT Report", from_date, to_date)
-    
-    # Style table and get data starting row
-    data_start_row = style_modern_table(ws, start_row, headers, styles)
-    
-    # Get payment vouchers
-    payment_vouchers = get_filtered_vouchers(
-        "Payment Voucher",
-        {
-            "type": "Receive",
-            "date": ["between", [from_date, to_date]],
-            "docstatus": 1,
-            "is_petty_cash": 0
+
+def delete_old_report_files(days=7):
+    """Scheduled job: remove generated report files older than `days`"""
+    for name in frappe.get_all(
+        'File',
+        filters={
+            'attached_to_doctype': 'Rua',
+            'attached_to_name': 'Rua',
+            'file_name': ['like', 'VAT_Report_%'],
+            'creation': ['<', add_days(now_datetime(), -days)]
         },
-        include_no_trn
-    )
-    
-    # Fill data
-    row = data_start_row
-    for idx, pv in enumerate(payment_vouchers, 1):
-        amount = float(pv.amount)
-        base_amount = amount / (1 + (vat_percentage / 100))
-        tax_amount = amount - base_amount
-        
-        data = [
-            (idx, 'center'),
-            (pv.date, 'center'),
-            (pv.name, 'left'),
-            (pv.party, 'left'),
-            (pv.trn, 'center'),
-            (round(base_amount, 2), 'right'),
-            (round(tax_amount, 2), 'right'),
-            (amount, 'right'),
-            (pv.emirate, 'center')
-        ]
-        
-        apply_row_styling(ws, row, data, styles)
-        row += 1
-    
-    # Add totals
-    if payment_vouchers:
-        row += 1
-        total_base = sum(float(pv.amount) / (1 + (vat_percentage / 100)) for pv in payment_vouchers)
-        total_tax = sum(float(pv.amount) - (float(pv.amount) / (1 + (vat_percentage / 100))) for pv in payment_vouchers)
-        total_amount = sum(float(pv.amount) for pv in payment_vouchers)
-        
-        # Merge cells for total label
-        ws.merge_cells(f'A{row}:E{row}')
-        total_label = ws.cell(row=row, column=1, value="Totals")
-        apply_style(total_label, styles['total'])
-        
-        # Add total amounts
-        for value, col in [
-            (round(total_base, 2), 6),
-            (round(total_tax, 2), 7),
-            (total_amount, 8)
-        ]:
-            cell = ws.cell(row=row, column=col, value=value)
-            apply_style(cell, styles['total'])
-            cell.number_format = '#,##0.00'
-            cell.alignment = Alignment(horizontal='right', vertical='center')
-
-def generate_petty_cash_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn):
-    """Generate petty cash sheet with enhanced styling"""
-    ws = wb.create_sheet(title="Petty Cash")
-    
-    headers = ['S. No.', 'Payment Date', 'Voucher Number', 'Party Name', 'Party TRN',
+        pluck='name'
+    ):
+        frappe.delete_doc('File', name, ignore_permissions=True)
+
+def generate_voucher_sheet(wb, title, report_title, party_label, payment_vouchers, from_date, to_date,
+                           vat_percentage, branding):
+    """Stream one detail sheet of vouchers, accumulating totals on the way"""
+    sheet = StreamingSheet(wb, title, VOUCHER_SHEET_COLUMNS)
+    apply_modern_branding(sheet, branding, report_title, from_date, to_date)
+
+    headers = ['S. No.', 'Payment Date', 'Voucher Number', f'{party_label} Name', f'{party_label} TRN',
                'Payment Amount', 'Tax Amount', 'Total Amount', 'Emirate']
-    
-    # Apply branding and get starting row
-    start_row = apply_modern_branding(ws, company_info, "Petty Cash VAT Report", from_date, to_date)
-    
-    # Style table and get data starting row
-    data_start_row = style_modern_table(ws, start_row, headers, styles)
-    
-    # Get payment vouchers
-    payment_vouchers = get_filtered_vouchers(
-        "Payment Voucher",
-        {
-            "date": ["between", [from_date, to_date]],
-            "docstatus": 1,
-            "is_petty_cash": 1
-        },
-        include_no_trn
-    )
-    
-    # Fill data
-    row = data_start_row
+    sheet.append([(header, 'vat_table_header') for header in headers], height=30)
+
+    striped_styles = [f'{style}_striped' for style in VOUCHER_ROW_STYLES]
+    count = total_base = total_tax = total_amount = 0
     for idx, pv in enumerate(payment_vouchers, 1):
         amount = float(pv.amount)
         base_amount = amount / (1 + (vat_percentage / 100))
         tax_amount = amount - base_amount
-        
-        data = [
-            (idx, 'center'),
-            (pv.date, 'center'),
-            (pv.name, 'left'),
-            (pv.party, 'left'),
-            (pv.trn, 'center'),
-            (round(base_amount, 2), 'right'),
-            (round(tax_amount, 2), 'right'),
-            (amount, 'right'),
-            (pv.emirate, 'center')
+
+        count = idx
+        total_base += base_amount
+        total_tax += tax_amount
+        total_amount += amount
+
+        values = [
+            idx, pv.date, pv.name, pv.party, pv.trn,
+            round(base_amount, 2), round(tax_amount, 2), amount, pv.emirate
         ]
-        
-        apply_row_styling(ws, row, data, styles)
-        row += 1
-    
+        # Subtle stripes on even rows
+        row_styles = striped_styles if (sheet.row + 1) % 2 == 0 else VOUCHER_ROW_STYLES
+        sheet.append(list(zip(values, row_styles)))
+
     # Add totals
-    if payment_vouchers:
-        row += 1
-        total_base = sum(float(pv.amount) / (1 + (vat_percentage / 100)) for pv in payment_vouchers)
-        total_tax = sum(float(pv.amount) - (float(pv.amount) / (1 + (vat_percentage / 100))) for pv in payment_vouchers)
-        total_amount = sum(float(pv.amount) for pv in payment_vouchers)
-        
-        # Merge cells for total label
-        ws.merge_cells(f'A{row}:E{row}')
-        total_label = ws.cell(row=row, column=1, value="Totals")
-        apply_style(total_label, styles['total'])
-        
-        # Add total amounts
-        for value, col in [
-            (round(total_base, 2), 6),
-            (round(total_tax, 2), 7),
-            (total_amount, 8)
-        ]:
-            cell = ws.cell(row=row, column=col, value=value)
-            apply_style(cell, styles['total'])
-            cell.number_format = '#,##0.00'
-            cell.alignment = Alignment(horizontal='right', vertical='center')
-
-def generate_summary_sheet(wb, from_date, to_date, vat_percentage, company_info, styles, include_no_trn):
+    if count:
+        sheet.append()
+        sheet.append(
+            [("Totals", 'vat_total')] + [None] * 4 + [
+                (round(total_base, 2), 'vat_total_amount'),
+                (round(total_tax, 2), 'vat_total_amount'),
+                (total_amount, 'vat_total_amount')
+            ],
+            merge=('A', 'E')
+        )
+
+def generate_summary_sheet(wb, from_date, to_date, vat_percentage, branding, include_no_trn):
     """Generate summary sheet with party-wise totals and final summary"""
-    ws = wb.create_sheet(title="Summary")
-    
+    sheet = StreamingSheet(wb, "Summary", dict(VOUCHER_SHEET_COLUMNS, C=30, D=15, E=15, F=15, G=15))
+
     # Apply branding
-    current_row = apply_modern_branding(ws, company_info, "VAT Summary Report", from_date, to_date)
-    current_row += 1
+    apply_modern_branding(sheet, branding, "VAT Summary Report", from_date, to_date)
+    sheet.append()
     
-    # Helper function to get party-wise totals
-    def get_party_totals(vouchers):
-        totals = {}
-        for pv in vouchers:
-            amount = float(pv.amount)
-            base_amount = amount / (1 + (vat_percentage / 100))
-            tax_amount = amount - base_amount
-            
-            if pv.party not in totals:
-                totals[pv.party] = {'base': 0, 'tax': 0, 'total': 0, 'trn': pv.trn}
-            
-            totals[pv.party]['base'] += base_amount
-            totals[pv.party]['tax'] += tax_amount
-            totals[pv.party]['total'] += amount
-        
-        return totals
-    
-    # Function to create a summary table
-    def create_summary_table(title, data, start_row):
-        # Add title
-        title_cell = ws.cell(row=start_row, column=3, value=title)  # Start from column C
-        title_cell.font = Font(name='Calibri', size=12, bold=True, color='2C3E50')
-        start_row += 1
-        
-        # Add headers
+    # Function to create a summary table, starting from column C
+    def create_summary_table(title, data):
+        sheet.append([None, None, (title, 'vat_section_title')])
+
         headers = ['Party Name', 'TRN', 'Base Amount', 'Tax Amount', 'Total Amount']
-        for col, header in enumerate(headers, 3):  # Start from column C (3)
-            cell = ws.cell(row=start_row, column=col, value=header)
-            apply_style(cell, styles['header'])
-        start_row += 1
-        
-        # Add data
+        sheet.append([None, None] + [(header, 'vat_summary_header') for header in headers])
+
         total_base = total_tax = total_amount = 0
-        for party, values in data.items():
-            ws.cell(row=start_row, column=3, value=party).alignment = Alignment(horizontal='left')  # Column C
-            ws.cell(row=start_row, column=4, value=values['trn']).alignment = Alignment(horizontal='center')  # Column D
-            
-            base_cell = ws.cell(row=start_row, column=5, value=round(values['base'], 2))  # Column E
-            tax_cell = ws.cell(row=start_row, column=6, value=round(values['tax'], 2))   # Column F
-            total_cell = ws.cell(row=start_row, column=7, value=round(values['total'], 2))  # Column G
-            
-            for cell in [base_cell, tax_cell, total_cell]:
-                cell.number_format = '"AED "#,##0.00'
-                cell.alignment = Alignment(horizontal='right')
-            
-            total_base += values['base']
-            total_tax += values['tax']
-            total_amount += values['total']
-            start_row += 1
-        
+        for values in data:
+            sheet.append([
+                None, None,
+                (values.party, 'vat_party'),
+                (values.trn, 'vat_party_trn'),
+                (round(flt(values.base), 2), 'vat_party_amount'),
+                (round(flt(values.tax), 2), 'vat_party_amount'),
+                (round(flt(values.total), 2), 'vat_party_amount')
+            ])
+
+            total_base += flt(values.base)
+            total_tax += flt(values.tax)
+            total_amount += flt(values.total)
+
         # Add totals
-        start_row += 1
-        ws.merge_cells(f'C{start_row}:D{start_row}')  # Merge C-D instead of A-B
-        total_label = ws.cell(row=start_row, column=3, value="Total")  # Column C
-        apply_style(total_label, styles['total'])
-        
-        for col, value in [(5, total_base), (6, total_tax), (7, total_amount)]:  # Adjusted columns
-            cell = ws.cell(row=start_row, column=col, value=round(value, 2))
-            apply_style(cell, styles['total'])
-            cell.number_format = '"AED "#,##0.00'
-            cell.alignment = Alignment(horizontal='right')
-        
-        return start_row + 2, total_tax
-    
-    # Get all vouchers
-    supplier_vouchers = get_filtered_vouchers(
-        "Payment Voucher",
-        {
-            "type": "Pay",
-            "date": ["between", [from_date, to_date]],
-            "docstatus": 1,
-            "is_petty_cash": 0
-        },
-        include_no_trn
-    )
-    
-    customer_vouchers = get_filtered_vouchers(
-        "Payment Voucher",
-        {
-            "type": "Receive",
-            "date": ["between", [from_date, to_date]],
-            "docstatus": 1,
-            "is_petty_cash": 0
-        },
-        include_no_trn
-    )
-    
-    petty_cash_vouchers = get_filtered_vouchers(
-        "Payment Voucher",
-        {
-            "date": ["between", [from_date, to_date]],
-            "docstatus": 1,
-            "is_petty_cash": 1
-        },
-        include_no_trn
-    )
+        sheet.append()
+        sheet.append(
+            [None, None, ("Total", 'vat_total'), None] + [
+                (round(value, 2), 'vat_total_summary') for value in (total_base, total_tax, total_amount)
+            ],
+            merge=('C', 'D')
+        )
+        sheet.append()
+
+        return total_tax
     
     # Create summary tables
-    current_row, supplier_tax = create_summary_table("Supplier Summary", get_party_totals(supplier_vouchers), current_row)
-    current_row, customer_tax = create_summary_table("Customer Summary", get_party_totals(customer_vouchers), current_row)
-    current_row, petty_cash_tax = create_summary_table("Petty Cash Summary", get_party_totals(petty_cash_vouchers), current_row)
+    party_totals = get_vat_party_totals(from_date, to_date, vat_percentage, include_no_trn)
+    tax = {
+        category: create_summary_table(f"{title} Summary", party_totals[category])
+        for category, title, *_ in VAT_CATEGORIES
+    }
     
     # Final Summary
-    current_row += 1
-    ws.merge_cells(f'C{current_row}:G{current_row}')  # Merge C-G instead of A-E
-    final_title = ws.cell(row=current_row, column=3, value="Final Summary")  # Column C
-    final_title.font = Font(name='Calibri', size=14, bold=True, color='2C3E50')
-    final_title.alignment = Alignment(horizontal='center')
-    current_row += 2
+    sheet.append()
+    sheet.append([None, None, ("Final Summary", 'vat_final_title')], merge=('C', 'G'))
+    sheet.append()
     
     # Add final calculations
-    total_purchases_tax = supplier_tax + petty_cash_tax
-    net_payable = total_purchases_tax - customer_tax
+    total_purchases_tax = tax['supplier'] + tax['petty_cash']
+    net_payable = total_purchases_tax - tax['customer']
     
     summary_data = [
         ("Purchases (Including Petty Cash)", total_purchases_tax),
-        ("Sales", customer_tax),
+        ("Sales", tax['customer']),
         ("Net Payable", net_payable)
     ]
     
     for label, value in summary_data:
-        ws.merge_cells(f'C{current_row}:F{current_row}')  # Merge C-F instead of A-D
-        label_cell = ws.cell(row=current_row, column=3, value=label)  # Column C
-        value_cell = ws.cell(row=current_row, column=7, value=value)  # Column G
-        
-        label_cell.font = Font(name='Calibri', size=11, bold=True)
-        value_cell.font = Font(name='Calibri', size=11, bold=True)
-        value_cell.number_format = '"AED "#,##0.00'
-        value_cell.alignment = Alignment(horizontal='right')
-        
-        current_row += 1
-    
-    # Adjust column widths
-    column_widths = {'C': 30, 'D': 15, 'E': 15, 'F': 15, 'G': 15}  # Adjusted columns
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
\ No newline at end of file
+        sheet.append(
+            [None, None, (label, 'vat_final_label'), None, None, None, (value, 'vat_final_value')],
+            merge=('C', 'F')
+        )
@@ -31,6 +31,51 @@ frappe.ui.form.on('Scope Items', {
                 }
             }, 100);
         }
+
+        if (!frm.is_new()) {
+            frm.add_custom_button(__('Duplicate'), function() {
+                const d = new frappe.ui.Dialog({
+                    title: __('Duplicate Scope Items'),
+                    fields: [
+                        {
+                            label: __('Project'),
+                            fieldname: 'project',
+                            fieldtype: 'Link',
+                            options: 'Project',
+                            default: frm.doc.project,
+                            reqd: 1
+                        },
+                        {
+                            label: __('Label'),
+                            fieldname: 'label',
+                            fieldtype: 'Data',
+                            default: `${frm.doc.label} (Copy)`,
+                            reqd: 1
+                        }
+                    ],
+                    primary_action_label: __('Duplicate'),
+                    primary_action(values) {
+                        frappe.call({
+                            method: 'rua_company.rua_company.doctype.scope_items.scope_items.clone_scope_items',
+                            args: {
+                                source: frm.doc.name,
+                                label: values.label,
+                                project: values.project
+                            },
+                            freeze: true,
+                            freeze_message: __('Duplicating...'),
+                            callback: function(r) {
+                                if (r.message) {
+                                    d.hide();
+                                    frappe.set_route('Form', 'Scope Items', r.message);
+                                }
+                            }
+                        });
+                    }
+                });
+                d.show();
+            });
+        }
     },
     project: function(frm) {
         if (frm.doc.project && frm.doc.scope_type) {
@@ -3,6 +3,7 @@
 
 import frappe
 import json
+import hashlib
 from frappe.model.document import Document
 from frappe.utils import flt, cint
 import math
@@ -10,7 +11,61 @@ import openpyxl
 from openpyxl.utils import get_column_letter
 from openpyxl.styles import Font, PatternFill
 import os
+import time
 from frappe.utils.file_manager import save_file
+from rua_company.rua_company.doctype.bill.bill import get_billable_projection, cache_billable_projection
+
+
+class FormulaProfiler:
+    """Collects evaluation statistics while a Scope Items document is calculated"""
+    def __init__(self):
+        self.stats = {}
+        self.passes = 0
+        self.totals_runs = 0
+        self.custom_function_calls = {}
+
+    def evaluate(self, kind, name, formula, eval_globals):
+        """Evaluate a formula, recording count, cumulative time and exceptions"""
+        stat = self.stats.setdefault((kind, name), {"count": 0, "time": 0.0, "errors": 0})
+        start = time.perf_counter()
+        try:
+            return eval(formula, eval_globals)
+        except Exception:
+            stat["errors"] += 1
+            raise
+        finally:
+            stat["count"] += 1
+            stat["time"] += time.perf_counter() - start
+
+    def wrap_function(self, name, func):
+        """Wrap a custom function so its calls are counted"""
+        def wrapper(*args, **kwargs):
+            self.custom_function_calls[name] = self.custom_function_calls.get(name, 0) + 1
+            return func(*args, **kwargs)
+        return wrapper
+
+    def as_dict(self):
+        """Return the collected statistics, most expensive formulas first"""
+        entries = [
+            {
+                "kind": kind,
+                "name": name,
+                "count": stat["count"],
+                "time_ms": round(stat["time"] * 1000, 3),
+                "avg_ms": round(stat["time"] * 1000 / stat["count"], 4) if stat["count"] else 0,
+                "errors": stat["errors"]
+            }
+            for (kind, name), stat in self.stats.items()
+        ]
+        entries.sort(key=lambda e: e["time_ms"], reverse=True)
+
+        return {
+            "fields": [e for e in entries if e["kind"] == "field"],
+            "formulas": [e for e in entries if e["kind"] == "formula"],
+            "passes": self.passes,
+            "totals_runs": self.totals_runs,
+            "custom_function_calls": self.custom_function_calls
+        }
 
 
 class ScopeItems(Document):
@@ -18,6 +73,20 @@ class ScopeItems(Document):
         self.load_custom_functions()
         self.calculate_item_values()
         self.calculate_totals()
+        self.bill_projection = get_billable_projection(self)
+        self.bill_digest = self.get_bill_digest(self.bill_projection)
+
+    def on_update(self):
+        # Serve the projection built during validate to bills and API consumers
+        cache_billable_projection(self, getattr(self, 'bill_projection', None))
+
+    def get_bill_digest(self, projection=None):
+        """Hash of the billable projection, used to skip bill refreshes when it is unchanged"""
+        if projection is None:
+            projection = get_billable_projection(self)
+        return hashlib.md5(
+            json.dumps(projection, sort_keys=True, default=str).encode()
+        ).hexdigest()
 
     def load_custom_functions(self):
         """Load custom functions for calculations"""
@@ -63,6 +132,13 @@ class ScopeItems(Document):
                     f"Error loading custom function {func.function_name}: {str(e)}"
                 )
 
+    def evaluate_formula(self, kind, name, formula, eval_globals):
+        """Evaluate a formula, through the profiler when profiling is enabled"""
+        profiler = getattr(self, 'profiler', None)
+        if profiler:
+            return profiler.evaluate(kind, name, formula, eval_globals)
+        return eval(formula, eval_globals)
+
     def get_eval_context(self, variables, doc_totals):
         """Get evaluation context for formulas"""
         class CustomFunctions:
@@ -70,6 +146,14 @@ class ScopeItems(Document):
                 for name, func in functions.items():
                     setattr(self, name, func)
         
+        custom_functions = self.custom_functions
+        profiler = getattr(self, 'profiler', None)
+        if profiler:
+            custom_functions = {
+                name: profiler.wrap_function(name, func)
+                for name, func in custom_functions.items()
+            }
+        
         # Get constants from constants_data
         constants = {}
         if hasattr(self, 'constants_data') and self.constants_data:
@@ -85,7 +169,7 @@ class ScopeItems(Document):
             "variables": variables,
             "doc_totals": doc_totals,
             "constants": constants,
-            "custom": CustomFunctions(self.custom_functions),
+            "custom": CustomFunctions(custom_functions),
             "frappe": frappe,
             "math": math,
             "flt": flt,
@@ -182,7 +266,7 @@ class ScopeItems(Document):
                             # Keep the variables[] reference intact
                             formula = f"({true_value}) if ({condition}) else ({false_value})"
                         
-                        result = eval(formula, eval_globals)
+                        result = self.evaluate_formula("field", field.field_name, formula, eval_globals)
                         
                         if field.field_type == 'Int':
                             result = cint(result)
@@ -240,7 +324,7 @@ class ScopeItems(Document):
                             # Keep the variables[] reference intact
                             formula = f"({true_value}) if ({condition}) else ({false_value})"
                         
-                        result = eval(formula, eval_globals)
+                        result = self.evaluate_formula("field", field.field_name, formula, eval_globals)
                         
                         if field.field_type == 'Int':
                             result = cint(result)
@@ -267,11 +351,17 @@ class ScopeItems(Document):
                     indicator='orange'
                 )
 
+        if getattr(self, 'profiler', None):
+            self.profiler.passes = pass_num + 1
+
         # Final totals calculation
         self.calculate_totals()
 
     def calculate_totals(self):
         """Calculate scope-level totals"""
+        if getattr(self, 'profiler', None):
+            self.profiler.totals_runs += 1
+
         if not self.scope_type or not self.items:
             # Clear totals if no items
             self.totals_data = json.dumps({})
@@ -412,7 +502,7 @@ class ScopeItems(Document):
                     # Add constants directly to context for backward compatibility
                     eval_globals.update(constants)
                     
-                    result = eval(formula.formula, eval_globals)
+                    result = self.evaluate_formula("formula", formula.field_name, formula.formula, eval_globals)
                 
                 # Convert result based on field type
                 if formula.field_type == 'Int':
@@ -600,6 +690,82 @@ def save_multiple_scope_items(scope_items, items_data, clear_existing=False):
     return doc
 
 
+@frappe.whitelist()
+def clone_scope_items(source, label, project=None, constants=None):
+    """Clone a Scope Items document, copying its rows with a single INSERT ... SELECT
+
+    Rows are never loaded as Documents. Item values are only recalculated (once)
+    when constants are overridden, otherwise the source totals are copied as-is.
+    """
+    # Rows are copied with raw SQL, so check the source the same way a read would
+    frappe.has_permission("Scope Items", "read", source, throw=True)
+
+    source_doc = frappe.db.get_value(
+        "Scope Items",
+        source,
+        ["scope_type", "project", "constants_data", "totals_data"],
+        as_dict=True
+    )
+    if not source_doc:
+        frappe.throw(f"Scope Items {source} not found")
+
+    constants_data = json.loads(source_doc.constants_data) if source_doc.constants_data else {}
+    constants = frappe.parse_json(constants) if constants else {}
+    constants_data.update(constants)
+
+    new_doc = frappe.get_doc({
+        "doctype": "Scope Items",
+        "scope_type": source_doc.scope_type,
+        "project": project or source_doc.project,
+        "label": label,
+        "status": "Draft",
+        "constants_data": json.dumps(constants_data)
+    })
+    new_doc.insert()
+
+    # Copy rows server-side; names and row_ids are regenerated from a per-clone salt
+    now = frappe.utils.now()
+    frappe.db.sql("""
+        INSERT INTO `tabScope Item Entry`
+            (name, creation, modified, modified_by, owner, docstatus, idx,
+             parent, parentfield, parenttype, item_name, row_id, data)
+        SELECT
+            SUBSTRING(MD5(CONCAT(%(salt)s, 'name', name)), 1, 10),
+            %(now)s, %(now)s, %(user)s, %(user)s, 0, idx,
+            %(parent)s, 'items', 'Scope Items', item_name,
+            SUBSTRING(MD5(CONCAT(%(salt)s, 'row', name)), 1, 10),
+            data
+        FROM `tabScope Item Entry`
+        WHERE parent = %(source)s
+            AND parenttype = 'Scope Items'
+            AND parentfield = 'items'
+    """, {
+        "salt": frappe.generate_hash(length=10),
+        "now": now,
+        "user": frappe.session.user,
+        "parent": new_doc.name,
+        "source": source
+    })
+
+    if constants:
+        # Constants changed, so item values and totals have to be recalculated once
+        new_doc = frappe.get_doc("Scope Items", new_doc.name)
+        new_doc.save()
+    else:
+        # Digest is left empty, it is recomputed on the next save. Bumping
+        # modified also invalidates the projection cached for the empty insert
+        frappe.db.set_value(
+            "Scope Items",
+            new_doc.name,
+            {
+                "totals_data": source_doc.totals_data or "{}",
+                "bill_digest": None
+            }
+        )
+
+    return new_doc.name
+
+
 @frappe.whitelist()
 def get_template_with_formulas(scope_items, include_data=False):
     """Generate an Excel template with formulas for scope items"""
@@ -6,9 +6,107 @@ frappe.ui.form.on('Scope Type', {
         frm.add_custom_button(__('Formula Documentation'), function() {
             show_formula_documentation();
         });
+
+        if (!frm.is_new()) {
+            frm.add_custom_button(__('Profile Formulas'), function() {
+                show_profile_dialog(frm);
+            });
+        }
     }
 });
 
+function show_profile_dialog(frm) {
+    const d = new frappe.ui.Dialog({
+        title: __('Profile Formulas'),
+        size: 'large',
+        fields: [
+            {
+                label: __('Scope Items'),
+                fieldname: 'scope_items',
+                fieldtype: 'Link',
+                options: 'Scope Items',
+                description: __('Leave empty to profile a synthetic document'),
+                get_query: () => ({ filters: { scope_type: frm.doc.name } })
+            },
+            {
+                label: __('Rows'),
+                fieldname: 'rows',
+                fieldtype: 'Int',
+                default: 100,
+                depends_on: 'eval:!doc.scope_items'
+            },
+            {
+                fieldname: 'results_html',
+                fieldtype: 'HTML'
+            }
+        ],
+        primary_action_label: __('Run'),
+        primary_action(values) {
+            frappe.call({
+                method: 'rua_company.rua_company.doctype.scope_type.scope_type.profile_formulas',
+                args: {
+                    scope_type: frm.doc.name,
+                    scope_items: values.scope_items,
+                    rows: values.rows
+                },
+                freeze: true,
+                freeze_message: __('Profiling...'),
+                callback: function(r) {
+                    if (r.message) {
+                        d.fields_dict.results_html.$wrapper.html(render_profile(r.message));
+                    }
+                }
+            });
+        }
+    });
+    d.show();
+}
+
+function render_profile(profile) {
+    const table = (title, entries) => `
+        <h6 class="mt-3">${title}</h6>
+        <table class="table table-bordered table-sm">
+            <thead>
+                <tr>
+                    <th>${__('Name')}</th>
+                    <th class="text-right">${__('Evaluations')}</th>
+                    <th class="text-right">${__('Total (ms)')}</th>
+                    <th class="text-right">${__('Avg (ms)')}</th>
+                    <th class="text-right">${__('Errors')}</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${entries.map(e => `
+                    <tr>
+                        <td>${e.name}</td>
+                        <td class="text-right">${e.count}</td>
+                        <td class="text-right">${e.time_ms}</td>
+                        <td class="text-right">${e.avg_ms}</td>
+                        <td class="text-right">${e.errors}</td>
+                    </tr>
+                `).join('') || `<tr><td colspan="5" class="text-muted">${__('None')}</td></tr>`}
+            </tbody>
+        </table>
+    `;
+
+    const functions = Object.entries(profile.custom_function_calls || {})
+        .map(([name, count]) => `<li><code>${name}</code>: ${count}</li>`)
+        .join('');
+
+    return `
+        ${profile.error ? `<div class="alert alert-danger">${profile.error}</div>` : ''}
+        <div>
+            ${__('Rows')}: <b>${profile.rows}</b> &middot;
+            ${__('Total time')}: <b>${profile.total_time_ms} ms</b> &middot;
+            ${__('Convergence passes')}: <b>${profile.passes}</b> &middot;
+            ${__('Totals runs')}: <b>${profile.totals_runs}</b>
+        </div>
+        ${table(__('Field Formulas'), profile.fields)}
+        ${table(__('Scope Formulas'), profile.formulas)}
+        ${functions ? `<h6 class="mt-3">${__('Custom Function Calls')}</h6><ul>${functions}</ul>` : ''}
+    `;
+}
+
 // Helper function to convert label to field name
 function labelToFieldName(label) {
     if (!label) return '';
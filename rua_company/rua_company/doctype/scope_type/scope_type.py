@@ -2,7 +2,13 @@
 # For license information, please see license.txt
 
 import frappe
+import json
+import time
 from frappe.model.document import Document
+from frappe.utils import flt, cint
+
+# Upper bound on synthetic rows, so profiling cannot tie up a worker indefinitely
+PROFILE_MAX_ROWS = 1000
 
 
 class ScopeType(Document):
@@ -82,3 +88,85 @@ class ScopeType(Document):
         # Clear cache for dependent doctypes
         frappe.clear_cache(doctype="Scope Item Entry")
         frappe.clear_cache(doctype="Scope Items")
+        frappe.cache.hdel("scope_type_bill_config", self.name)
+        # in_bill flags may have changed, so cached billable projections are stale
+        frappe.cache.delete_keys("scope_items_bill_projection::")
+
+    def on_trash(self):
+        frappe.cache.hdel("scope_type_bill_config", self.name)
+
+
+@frappe.whitelist()
+def profile_formulas(scope_type, scope_items=None, rows=100):
+    """Profile formula evaluation for a scope type
+
+    Runs the Scope Items calculation against an existing document, or against a
+    synthetic one with `rows` items (at most PROFILE_MAX_ROWS) filled from field
+    defaults, without saving. Restricted to those who can edit the scope type.
+    """
+    from rua_company.rua_company.doctype.scope_items.scope_items import FormulaProfiler
+
+    if "System Manager" not in frappe.get_roles():
+        frappe.has_permission("Scope Type", "write", scope_type, throw=True)
+
+    if scope_items:
+        frappe.has_permission("Scope Items", "read", scope_items, throw=True)
+        doc = frappe.get_doc("Scope Items", scope_items)
+        if doc.scope_type != scope_type:
+            frappe.throw(f"{scope_items} does not belong to Scope Type {scope_type}")
+    else:
+        doc = build_synthetic_scope_items(scope_type, min(cint(rows) or 100, PROFILE_MAX_ROWS))
+
+    doc.profiler = FormulaProfiler()
+    error = None
+    start = time.perf_counter()
+    try:
+        doc.load_custom_functions()
+        doc.calculate_item_values()
+        doc.calculate_totals()
+    except frappe.ValidationError as e:
+        # Keep the partial profile, the failing formula shows up with errors
+        error = str(e)
+    total_time = time.perf_counter() - start
+
+    result = doc.profiler.as_dict()
+    result.update({
+        "scope_items": scope_items,
+        "rows": len(doc.items),
+        "total_time_ms": round(total_time * 1000, 3),
+        "error": error
+    })
+    return result
+
+
+def build_synthetic_scope_items(scope_type, rows):
+    """Build an unsaved Scope Items document with generated items"""
+    scope_type_doc = frappe.get_doc("Scope Type", scope_type)
+
+    data = {}
+    for field in scope_type_doc.scope_fields:
+        if field.auto_calculate:
+            continue
+        if field.field_type in ['Float', 'Currency', 'Percent']:
+            data[field.field_name] = flt(field.default_value) or 1.0
+        elif field.field_type == 'Int':
+            data[field.field_name] = cint(field.default_value) or 1
+        elif field.field_type == 'Select':
+            options = [o for o in (field.options or "").split('\n') if o]
+            data[field.field_name] = field.default_value or (options[0] if options else "")
+        else:
+            data[field.field_name] = field.default_value or ""
+
+    constants = {constant.constant_name: 1.0 for constant in scope_type_doc.constants}
+
+    doc = frappe.new_doc("Scope Items")
+    doc.scope_type = scope_type
+    doc.constants_data = json.dumps(constants)
+    for idx in range(rows):
+        doc.append("items", {
+            "row_id": f"profile-{idx}",
+            "item_name": f"Item {idx + 1}",
+            "data": json.dumps(data)
+        })
+
+    return doc
@@ -0,0 +1,114 @@
+# Copyright (c) 2026, Yamen Zakhour and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt, get_first_day, now
+
+# VAT report category of a Payment Voucher aliased as `pv`
+VAT_CATEGORY_SQL = """
+	CASE
+		WHEN pv.petty_cash = 1 THEN 'petty_cash'
+		WHEN pv.type = 'Pay' THEN 'supplier'
+		ELSE 'customer'
+	END
+"""
+
+
+class VATLedger(Document):
+	pass
+
+def on_doctype_update():
+	frappe.db.add_unique("VAT Ledger", ["month", "category", "party", "emirate"], constraint_name="unique_vat_ledger_key")
+
+def get_vat_factor():
+	return 1 + flt(frappe.db.get_single_value("Rua", "vat") or 5) / 100
+
+def get_vat_category(voucher):
+	if voucher.petty_cash:
+		return "petty_cash"
+	return "supplier" if voucher.type == "Pay" else "customer"
+
+def post_voucher(voucher, sign=1):
+	"""Add (or with sign=-1 remove) a voucher's amounts to its monthly ledger row
+
+	The emirate is read from the party at posting time; if it changes between
+	submit and cancel, the nightly rebuild corrects the split.
+	"""
+	total = sign * flt(voucher.payment_amount)
+	base = total / get_vat_factor()
+	timestamp = now()
+
+	frappe.db.sql("""
+		INSERT INTO `tabVAT Ledger`
+			(name, creation, modified, owner, modified_by,
+			month, category, party, emirate, base, tax, total, vouchers)
+		VALUES
+			(%(name)s, %(timestamp)s, %(timestamp)s, %(user)s, %(user)s,
+			%(month)s, %(category)s, %(party)s, %(emirate)s, %(base)s, %(tax)s, %(total)s, %(vouchers)s)
+		ON DUPLICATE KEY UPDATE
+			base = base + VALUES(base),
+			tax = tax + VALUES(tax),
+			total = total + VALUES(total),
+			vouchers = vouchers + VALUES(vouchers),
+			modified = VALUES(modified),
+			modified_by = VALUES(modified_by)
+	""", {
+		"name": frappe.generate_hash(length=10),
+		"timestamp": timestamp,
+		"user": frappe.session.user,
+		"month": get_first_day(voucher.date),
+		"category": get_vat_category(voucher),
+		"party": voucher.party or "",
+		"emirate": frappe.db.get_value("Party", voucher.party, "emirate") or "",
+		"base": base,
+		"tax": total - base,
+		"total": total,
+		"vouchers": sign
+	})
+
+def rebuild_vat_ledger():
+	"""Recompute every ledger row from submitted Payment Vouchers"""
+	vat_factor = get_vat_factor()
+	timestamp = now()
+
+	frappe.db.delete("VAT Ledger")
+	frappe.db.sql(f"""
+		INSERT INTO `tabVAT Ledger`
+			(name, creation, modified, owner, modified_by,
+			month, category, party, emirate, base, tax, total, vouchers)
+		SELECT
+			SUBSTRING(MD5(CONCAT_WS('::', month, category, party, emirate)), 1, 10),
+			%(timestamp)s, %(timestamp)s, %(user)s, %(user)s,
+			month, category, party, emirate,
+			total / %(vat_factor)s, total - total / %(vat_factor)s, total, vouchers
+		FROM (
+			SELECT
+				DATE_FORMAT(pv.date, '%%Y-%%m-01') AS month,
+				{VAT_CATEGORY_SQL} AS category,
+				IFNULL(pv.party, '') AS party,
+				IFNULL(p.emirate, '') AS emirate,
+				SUM(pv.payment_amount) AS total,
+				COUNT(*) AS vouchers
+			FROM `tabPayment Voucher` pv
+			LEFT JOIN `tabParty` p ON p.name = pv.party
+			WHERE pv.docstatus = 1
+			GROUP BY month, category, party, emirate
+		) grouped
+	""", {"timestamp": timestamp, "user": frappe.session.user, "vat_factor": vat_factor})
+
+def get_vat_ledger_version():
+	"""Changes whenever a voucher is posted or the ledger is rebuilt"""
+	version = frappe.db.sql("SELECT COUNT(*), MAX(modified) FROM `tabVAT Ledger`")[0]
+	return f"{version[0]}@{version[1]}"
+
+def handle_payment_voucher_submit(doc, method=None):
+	post_voucher(doc)
+
+def handle_payment_voucher_cancel(doc, method=None):
+	post_voucher(doc, sign=-1)
+
+def reconcile_vat_ledger():
+	"""Scheduled job: rebuild the ledger to correct any drift"""
+	rebuild_vat_ledger()
+	frappe.db.commit()
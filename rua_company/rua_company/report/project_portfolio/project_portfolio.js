@@ -0,0 +1,20 @@
+// Copyright (c) 2026, Yamen Zakhour and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Project Portfolio"] = {
+	filters: [
+		{
+			fieldname: "status",
+			label: __("Status"),
+			fieldtype: "Select",
+			options: "\nTender\nJob In Hand\nIn Progress\nCompleted\nCancelled",
+			default: "In Progress"
+		},
+		{
+			fieldname: "client",
+			label: __("Client"),
+			fieldtype: "Link",
+			options: "Party"
+		}
+	]
+};
@@ -0,0 +1,61 @@
+# Copyright (c) 2026, Yamen Zakhour and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.utils import flt
+
+
+def execute(filters=None):
+	filters = frappe._dict(filters or {})
+	return get_columns(), get_data(filters)
+
+def get_columns():
+	return [
+		{"fieldname": "project", "label": _("Project"), "fieldtype": "Link", "options": "Project", "width": 180},
+		{"fieldname": "project_name", "label": _("Project Name"), "fieldtype": "Data", "width": 200},
+		{"fieldname": "client", "label": _("Client"), "fieldtype": "Link", "options": "Party", "width": 160},
+		{"fieldname": "status", "label": _("Status"), "fieldtype": "Data", "width": 110},
+		{"fieldname": "contract_value", "label": _("Contract Value"), "fieldtype": "Currency", "width": 130},
+		{"fieldname": "po_costs", "label": _("PO Costs"), "fieldtype": "Currency", "width": 130},
+		{"fieldname": "profit", "label": _("Profit"), "fieldtype": "Currency", "width": 130},
+		{"fieldname": "received", "label": _("Received"), "fieldtype": "Currency", "width": 130},
+		{"fieldname": "paid", "label": _("Paid"), "fieldtype": "Currency", "width": 130},
+		{"fieldname": "petty_cash", "label": _("Petty Cash"), "fieldtype": "Currency", "width": 130},
+		{"fieldname": "outstanding", "label": _("Outstanding"), "fieldtype": "Currency", "width": 130}
+	]
+
+def get_data(filters):
+	"""One row per project, read from the materialized Project KPI table"""
+	conditions = []
+	if filters.status:
+		conditions.append("p.status = %(status)s")
+	if filters.client:
+		conditions.append("""EXISTS (SELECT 1 FROM `tabParties`
+			WHERE parent = p.name AND parenttype = 'Project' AND type = 'Client'
+				AND party = %(client)s)""")
+
+	where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+	rows = frappe.db.sql(f"""
+		SELECT
+			p.name AS project, p.project_name, p.status,
+			(SELECT party FROM `tabParties`
+				WHERE parent = p.name AND parenttype = 'Project' AND type = 'Client'
+				ORDER BY idx LIMIT 1) AS client,
+			p.contract_value,
+			IFNULL(k.po_costs, 0) AS po_costs,
+			IFNULL(k.received, 0) AS received,
+			IFNULL(k.paid, 0) AS paid,
+			IFNULL(k.petty_cash, 0) AS petty_cash,
+			IFNULL(k.outstanding, p.contract_value) AS outstanding
+		FROM `tabProject` p
+		LEFT JOIN `tabProject KPI` k ON k.name = p.name
+		{where}
+		ORDER BY p.serial_number DESC, p.creation DESC
+	""", filters, as_dict=True)
+
+	for row in rows:
+		row.profit = flt(row.contract_value) - flt(row.po_costs)
+
+	return rows
@@ -0,0 +1,61 @@
+import io
+import os
+
+import frappe
+from PIL import Image as PILImage
+
+LOGO_HEIGHT = 45  # pixels
+BRANDING_CACHE_TTL = 24 * 60 * 60
+
+
+def get_branding() -> dict:
+    """Company info, brand colour and the pre-resized logo shared by generated workbooks
+
+    Cached under the `Rua` document's modified time and the logo file's mtime,
+    so the logo is decoded and resized once per change rather than per sheet.
+    """
+    modified, logo_url = frappe.db.get_value("Rua", "Rua", ["modified", "logo_horizontal"])
+    logo_path = get_logo_path(logo_url)
+    logo_mtime = os.path.getmtime(logo_path) if logo_path else None
+
+    key = f"rua_branding::{modified}::{logo_mtime}"
+    branding = frappe.cache.get_value(key)
+    if branding is None:
+        branding = build_branding(logo_path)
+        frappe.cache.set_value(key, branding, expires_in_sec=BRANDING_CACHE_TTL)
+
+    branding["company_info"] = frappe._dict(branding["company_info"])
+    return branding
+
+
+def get_logo_path(logo_url: str | None) -> str | None:
+    if not logo_url:
+        return None
+    path = frappe.get_site_path("public", logo_url.lstrip("/"))
+    return path if os.path.exists(path) else None
+
+
+def build_branding(logo_path: str | None) -> dict:
+    company_info = frappe.db.get_singles_dict("Rua")
+    branding = {
+        "company_info": dict(company_info),
+        "brand_color": (company_info.get("brand_color") or "#2C3E50").lstrip("#"),
+        "logo": None,
+    }
+
+    if logo_path:
+        with PILImage.open(logo_path) as img:
+            img = img.convert("RGB")
+            width = int(LOGO_HEIGHT * img.width / img.height)
+            img = img.resize((width, LOGO_HEIGHT))
+
+            img_bytes = io.BytesIO()
+            img.save(img_bytes, format="PNG")
+
+        branding["logo"] = {
+            "content": img_bytes.getvalue(),
+            "width": width,
+            "height": LOGO_HEIGHT,
+        }
+
+    return branding
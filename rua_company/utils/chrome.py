@@ -0,0 +1,389 @@
+import atexit
+import base64
+import ctypes
+import ctypes.util
+import fcntl
+import json
+import os
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+
+from rua_company.utils.render_limits import acquire_slot, get_max_renders, render_slot
+
+# Pool defaults, overridable from site_config.json
+DEFAULT_POOL_SIZE = 2  # concurrent browsers per worker process
+DEFAULT_MAX_JOBS = 100  # renders before a browser is recycled
+DEFAULT_IDLE_CHECK = 60  # seconds idle before a browser is pinged on checkout
+DEFAULT_IDLE_TIMEOUT = 300  # seconds an unused browser is kept running
+DEFAULT_RENDER_TIMEOUT = 60  # seconds
+
+# Lock files bounding the browsers kept running between renders, host-wide
+BROWSER_SLOT_DIR = os.path.join(tempfile.gettempdir(), "rua-chrome-slots")
+REAP_INTERVAL = 30  # seconds between checks for idle browsers
+
+PR_SET_PDEATHSIG = 1
+try:
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+except OSError:
+    libc = None
+
+
+class ChromeError(Exception):
+    pass
+
+
+class ChromeTimeout(ChromeError, TimeoutError):
+    pass
+
+
+class ChromeBrowser:
+    """A long-lived headless Chrome driven over the DevTools protocol
+
+    Uses `--remote-debugging-pipe`: Chrome reads NUL-terminated JSON messages
+    from fd 3 and writes its replies and events to fd 4, so no websocket
+    client or debugging port is needed.
+    """
+
+    def __init__(self):
+        self.user_data_dir = tempfile.mkdtemp(prefix="rua-chrome-")
+        self.jobs = 0
+        self.last_used = time.monotonic()
+        self.message_id = 0
+        self.buffer = b""
+        self.events = []
+        self.slot = None
+
+        to_chrome_read, to_chrome_write = os.pipe()
+        from_chrome_read, from_chrome_write = os.pipe()
+
+        def attach_pipes():
+            # Move both ends clear of 3 and 4 first so neither dup2 clobbers the other
+            read_end = fcntl.fcntl(to_chrome_read, fcntl.F_DUPFD, 10)
+            write_end = fcntl.fcntl(from_chrome_write, fcntl.F_DUPFD, 10)
+            os.dup2(read_end, 3)
+            os.dup2(write_end, 4)
+            # Die with the thread that started us (the pool's launcher thread),
+            # even when the worker leaves through os._exit and atexit never runs
+            if libc:
+                libc.prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+
+        self.process = subprocess.Popen(
+            [
+                get_chrome_binary(),
+                "--headless",
+                "--disable-gpu",
+                "--no-sandbox",
+                "--no-first-run",
+                "--no-default-browser-check",
+                "--disable-extensions",
+                "--disable-background-networking",
+                "--run-all-compositor-stages-before-draw",
+                "--remote-debugging-pipe",
+                f"--user-data-dir={self.user_data_dir}",
+                "about:blank",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            preexec_fn=attach_pipes,
+            pass_fds=(3, 4),
+            shell=False,
+        )
+        os.close(to_chrome_read)
+        os.close(from_chrome_write)
+        self.writer = to_chrome_write
+        self.reader = from_chrome_read
+
+    def send(self, method, params=None, session_id=None, timeout=DEFAULT_RENDER_TIMEOUT):
+        """Send a command and wait for its result, keeping events seen meanwhile"""
+        self.message_id += 1
+        message = {"id": self.message_id, "method": method, "params": params or {}}
+        if session_id:
+            message["sessionId"] = session_id
+        os.write(self.writer, json.dumps(message).encode() + b"\0")
+
+        deadline = time.monotonic() + timeout
+        while True:
+            reply = self.receive(deadline)
+            if reply.get("id") == self.message_id:
+                if "error" in reply:
+                    raise ChromeError(f"{method}: {reply['error'].get('message')}")
+                return reply.get("result", {})
+            if "method" in reply:
+                self.events.append(reply)
+
+    def wait_for_event(self, method, session_id=None, timeout=DEFAULT_RENDER_TIMEOUT):
+        def matches(event):
+            return event.get("method") == method and event.get("sessionId") == session_id
+
+        for event in self.events:
+            if matches(event):
+                self.events.remove(event)
+                return event.get("params", {})
+
+        deadline = time.monotonic() + timeout
+        while True:
+            event = self.receive(deadline)
+            if matches(event):
+                return event.get("params", {})
+
+    def receive(self, deadline):
+        while b"\0" not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ChromeTimeout("Timed out waiting for Chrome")
+            ready, _, _ = select.select([self.reader], [], [], remaining)
+            if not ready:
+                continue
+            chunk = os.read(self.reader, 1 << 16)
+            if not chunk:
+                raise ChromeError("Chrome closed the DevTools pipe")
+            self.buffer += chunk
+
+        message, self.buffer = self.buffer.split(b"\0", 1)
+        return json.loads(message)
+
+    def print_to_pdf(self, url, print_options=None, timeout=DEFAULT_RENDER_TIMEOUT):
+        """Load `url` in a fresh tab and return the printed PDF bytes"""
+        deadline = time.monotonic() + timeout
+        self.events = []
+
+        def remaining():
+            return max(deadline - time.monotonic(), 0.001)
+
+        # On any failure the pool kills the browser, which closes the tab with it
+        target_id = self.send("Target.createTarget", {"url": "about:blank"}, timeout=remaining())["targetId"]
+        session_id = self.send(
+            "Target.attachToTarget", {"targetId": target_id, "flatten": True}, timeout=remaining()
+        )["sessionId"]
+        self.send("Page.enable", session_id=session_id, timeout=remaining())
+        self.send("Page.navigate", {"url": url}, session_id=session_id, timeout=remaining())
+        self.wait_for_event("Page.loadEventFired", session_id=session_id, timeout=remaining())
+
+        result = self.send(
+            "Page.printToPDF",
+            {
+                "printBackground": True,
+                "preferCSSPageSize": True,
+                "displayHeaderFooter": False,
+                **(print_options or {}),
+            },
+            session_id=session_id,
+            timeout=remaining(),
+        )
+        self.send("Target.closeTarget", {"targetId": target_id}, timeout=5)
+
+        self.jobs += 1
+        self.last_used = time.monotonic()
+        return base64.b64decode(result["data"])
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def hold_slot(self):
+        """Take one of the host's slots for browsers kept between renders"""
+        if self.slot is None:
+            self.slot = acquire_slot(get_max_idle_browsers(), 0, slot_dir=BROWSER_SLOT_DIR)
+        return self.slot is not None
+
+    def is_healthy(self):
+        """Cheap check for recently used browsers, a DevTools ping for idle ones"""
+        if not self.is_alive():
+            return False
+        if time.monotonic() - self.last_used < get_pool_setting("rua_pdf_idle_check", DEFAULT_IDLE_CHECK):
+            return True
+        try:
+            self.send("Browser.getVersion", timeout=5)
+            return True
+        except (ChromeError, OSError, ValueError):
+            return False
+
+    def kill(self):
+        """Stop the browser at once, for hung or broken renders"""
+        if self.is_alive():
+            self.process.kill()
+            self.process.wait()
+        self.close()
+
+    def close(self):
+        if self.is_alive():
+            try:
+                self.send("Browser.close", timeout=5)
+                self.process.wait(timeout=5)
+            except (ChromeError, OSError, ValueError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.release_fds()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+    def release_fds(self):
+        for fd in (self.writer, self.reader, self.slot):
+            if fd is None:
+                continue
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.slot = None
+
+
+class ChromePool:
+    """Browsers of this worker process, one tab per render
+
+    Browsers kept between renders are bounded host-wide: each holds one of
+    rua_pdf_max_idle_browsers lock files, and is closed when none is free or
+    once it has been unused for rua_pdf_idle_timeout seconds. Health checks
+    and closes run outside the pool lock, so they never hold up other renders.
+    """
+
+    def __init__(self):
+        self.idle = []
+        self.size = 0
+        self.condition = threading.Condition()
+        self.idle_timeout = DEFAULT_IDLE_TIMEOUT
+        self.reaper = None
+        self.launcher = None
+
+    def acquire(self, timeout=None):
+        while True:
+            with self.condition:
+                while not self.idle and self.size >= get_pool_setting("rua_pdf_pool_size", DEFAULT_POOL_SIZE):
+                    if not self.condition.wait(timeout):
+                        raise ChromeError("No browser became available")
+
+                browser = self.idle.pop() if self.idle else None
+                if browser is None:
+                    self.size += 1
+                    break
+
+            if browser.is_healthy():
+                return browser
+            self.discard(browser)
+
+        try:
+            return self.launch()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def launch(self):
+        """Start a browser from the pool's long-lived launcher thread
+
+        Chrome is killed when the thread that started it exits, so it must not
+        be started from short-lived ones such as get_pdfs' batch threads.
+        """
+        with self.condition:
+            if self.launcher is None:
+                self.launcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rua-chrome-launcher")
+        return self.launcher.submit(ChromeBrowser).result()
+
+    def release(self, browser, failed=False):
+        self.idle_timeout = get_pool_setting("rua_pdf_idle_timeout", DEFAULT_IDLE_TIMEOUT)
+
+        if (
+            failed
+            or browser.jobs >= get_pool_setting("rua_pdf_max_jobs", DEFAULT_MAX_JOBS)
+            or not browser.hold_slot()
+        ):
+            self.discard(browser, kill=failed)
+            return
+
+        with self.condition:
+            self.idle.append(browser)
+            self.condition.notify()
+            if self.reaper is None or not self.reaper.is_alive():
+                self.reaper = threading.Thread(target=self.reap_idle, name="rua-chrome-reaper", daemon=True)
+                self.reaper.start()
+
+    def discard(self, browser, kill=False):
+        """Free a browser's place in the pool, then close (or kill) it"""
+        with self.condition:
+            self.size -= 1
+            self.condition.notify()
+
+        if kill:
+            browser.kill()
+        else:
+            browser.close()
+
+    def reap_idle(self):
+        """Close browsers left unused for idle_timeout; exits once none are idle"""
+        while True:
+            time.sleep(min(self.idle_timeout, REAP_INTERVAL))
+
+            cutoff = time.monotonic() - self.idle_timeout
+            with self.condition:
+                expired = [browser for browser in self.idle if browser.last_used < cutoff]
+                self.idle = [browser for browser in self.idle if browser.last_used >= cutoff]
+
+            for browser in expired:
+                self.discard(browser)
+
+            with self.condition:
+                if not self.idle:
+                    self.reaper = None
+                    return
+
+    def shutdown(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+        for browser in idle:
+            self.discard(browser)
+
+    def forget(self):
+        """In a forked child: drop the parent's browsers without touching them"""
+        for browser in self.idle:
+            browser.release_fds()
+        self.__init__()
+
+
+pool = ChromePool()
+atexit.register(pool.shutdown)
+os.register_at_fork(after_in_child=pool.forget)
+
+
+def render_pdf(url, print_options=None, timeout=None):
+    """Print `url` with a pooled browser within one of the host's render slots
+
+    A failed render is retried once on a fresh browser; a render that times
+    out has its browser killed and is not retried.
+    """
+    timeout = timeout or get_pool_setting("rua_pdf_render_timeout", DEFAULT_RENDER_TIMEOUT)
+
+    with render_slot():
+        for attempt in range(2):
+            browser = pool.acquire(timeout=timeout)
+            try:
+                content = browser.print_to_pdf(url, print_options, timeout=timeout)
+            except ChromeTimeout:
+                pool.release(browser, failed=True)
+                raise
+            except (ChromeError, OSError, ValueError):
+                pool.release(browser, failed=True)
+                if attempt:
+                    raise
+            else:
+                pool.release(browser)
+                return content
+
+
+def get_chrome_binary():
+    return "google-chrome" if shutil.which("google-chrome") else "google-chrome-stable"
+
+
+def get_max_idle_browsers():
+    return get_pool_setting("rua_pdf_max_idle_browsers", get_max_renders())
+
+
+def get_pool_setting(key, default):
+    return int(frappe.conf.get(key) or default)
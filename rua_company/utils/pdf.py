@@ -1,15 +1,17 @@
 import io
-import os
 import re
-import shutil
-import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import frappe
-from frappe.utils import get_url
+from frappe.utils import cint, get_url
 from frappe.utils.pdf import prepare_options
 from pypdf import PdfReader, PdfWriter
 
+from rua_company.utils import pdf_cache
+from rua_company.utils.chrome import render_pdf
+from rua_company.utils.pdf_assets import inline_stylesheets, resolve_local_url
+
 URLS_NOT_HTTP_TAG_PATTERN = re.compile(
     r'(href|src){1}([\s]*=[\s]*[\'"]?)((?!http)[^\'">]+)([\'"]?)'
 )  # href=/assets/...
@@ -28,6 +30,9 @@ def expand_relative_urls(html: str) -> str:
     if url.endswith("/"):
         url = url[:-1]
 
+    # Inlined rather than linked, so paged.js needs no file:// fetch to read them
+    html = inline_stylesheets(html, url)
+
     URLS_HTTP_TAG_PATTERN = re.compile(
         r'(href|src)([\s]*=[\s]*[\'"]?)((?:{0})[^\'">]+)([\'"]?)'.format(
             re.escape(url.replace("https://", "http://"))
@@ -40,9 +45,27 @@ def expand_relative_urls(html: str) -> str:
         )
     )  # background-image: url('/assets/...')
 
+    def _localize_url(ref):
+        for site_url in (url, url.replace("https://", "http://")):
+            if ref.startswith(site_url):
+                ref = ref[len(site_url):]
+                break
+        if ref.startswith(("mailto", "data:", "tel:", "http:", "https:")):
+            return None
+        return resolve_local_url(ref if ref.startswith("/") else "/" + ref)
+
     def _expand_relative_urls(match):
         to_expand = list(match.groups())
 
+        # Already localized by an earlier pattern
+        if to_expand[2].startswith("file:"):
+            return match.group(0)
+
+        # Site assets and files are read from disk instead of fetched from a web worker
+        if local_url := _localize_url(to_expand[2]):
+            to_expand[2] = local_url
+            return "".join(to_expand)
+
         if not to_expand[2].startswith(("mailto", "data:", "tel:")):
             if not to_expand[2].startswith(url):
                 if not to_expand[2].startswith("/"):
@@ -72,7 +95,41 @@ def expand_relative_urls(html: str) -> str:
 
 
 def get_pdf(html, options=None, output: PdfWriter | None = None):
-    pdf_file_path = f"/tmp/{frappe.generate_hash()}.pdf"
+    # Keyed before scrub_urls, which adds the per-session sid to every URL
+    cache_key = pdf_cache.get_cache_key(html, options)
+    content = pdf_cache.get(cache_key)
+    if content is None:
+        content = render_html(html, options)
+        pdf_cache.put(cache_key, content)
+
+    reader = PdfReader(io.BytesIO(content))
+
+    if output:
+        output.append_pages_from_reader(reader)
+        return output
+
+    writer = PdfWriter()
+    writer.append_pages_from_reader(reader)
+
+    if options and "password" in options:
+        password = options["password"]
+        writer.encrypt(password)
+
+    filedata = get_file_data_from_writer(writer)
+
+    return filedata
+
+
+def render_html(html, options=None):
+    """Print HTML to PDF bytes with the page size and margins applied"""
+    return print_html(prepare_html(html, options))
+
+
+def prepare_html(html, options=None):
+    """Expand URLs and prepend the page size and margin styles
+
+    Needs the request context, so batch renders run it before fanning out.
+    """
     html = scrub_urls(html)
     
     # Ensure options is a dict and set zero margins and A4 size
@@ -123,47 +180,81 @@ def get_pdf(html, options=None, output: PdfWriter | None = None):
             }}
             </style>"""
 
-    html = additional_style + html
+    return additional_style + html
+
 
+def print_html(html):
     with tempfile.NamedTemporaryFile(
         mode="w+", suffix=f"{frappe.generate_hash()}.html", delete=True
     ) as html_file:
         html_file.write(html)
-        html_file.seek(0)
-        chrome_command = [
-            "google-chrome"
-            if shutil.which("google-chrome")
-            else "google-chrome-stable",
-            "--headless",
-            "--disable-gpu",
-            "--no-sandbox",
-            "--no-pdf-header-footer",
-            "--run-all-compositor-stages-before-draw",
-            f"--print-to-pdf={pdf_file_path}",
-            html_file.name,
-        ]
-        subprocess.run(chrome_command, shell=False)
-        content = None
-        with open(pdf_file_path, "rb") as f:
-            content = f.read()
-        os.remove(pdf_file_path)
+        html_file.flush()
+        # Rendered in a tab of a pooled, long-lived browser
+        content = render_pdf(f"file://{html_file.name}")
 
-    reader = PdfReader(io.BytesIO(content))
+    return content
 
-    if output:
-        output.append_pages_from_reader(reader)
-        return output
+
+def get_pdfs(htmls, options=None, parallelism=None):
+    """Render many HTML documents concurrently and merge them into one PDF
+
+    Cached documents are not rendered again. The rest go through the browser
+    pool `parallelism` at a time (rua_pdf_batch_parallelism, default 2), and
+    each result is appended to the output in order as soon as it is ready
+    rather than after the whole batch.
+    """
+    parallelism = cint(parallelism or frappe.conf.get("rua_pdf_batch_parallelism") or 2)
+    site, sites_path = frappe.local.site, frappe.local.sites_path
+
+    jobs = []
+    for html in htmls:
+        cache_key = pdf_cache.get_cache_key(html, options)
+        cached = pdf_cache.get(cache_key)
+        prepared = None if cached else prepare_html(html, dict(options or {}))
+        jobs.append((cache_key, cached, prepared))
+
+    def render(job):
+        cache_key, cached, prepared = job
+        if cached:
+            return cached
+
+        # Worker threads need their own site context for config and cache access
+        frappe.init(site=site, sites_path=sites_path)
+        try:
+            content = print_html(prepared)
+            pdf_cache.put(cache_key, content)
+            return content
+        finally:
+            frappe.destroy()
 
     writer = PdfWriter()
-    writer.append_pages_from_reader(reader)
+    with ThreadPoolExecutor(max_workers=max(parallelism, 1)) as executor:
+        for content in executor.map(render, jobs):
+            writer.append_pages_from_reader(PdfReader(io.BytesIO(content)))
 
-    if "password" in options:
-        password = options["password"]
-        writer.encrypt(password)
+    if options and "password" in options:
+        writer.encrypt(options["password"])
 
-    filedata = get_file_data_from_writer(writer)
+    return get_file_data_from_writer(writer)
 
-    return filedata
+
+@frappe.whitelist()
+def download_merged_pdf(doctype, names, format=None, no_letterhead=0, letterhead=None):
+    """Print several documents into one PDF, rendering them concurrently"""
+    names = frappe.parse_json(names)
+    if isinstance(names, str):
+        names = [names]
+
+    htmls = []
+    for name in names:
+        frappe.has_permission(doctype, "print", name, throw=True)
+        htmls.append(
+            frappe.get_print(doctype, name, format, no_letterhead=cint(no_letterhead), letterhead=letterhead)
+        )
+
+    frappe.local.response.filename = f"{doctype}.pdf"
+    frappe.local.response.filecontent = get_pdfs(htmls)
+    frappe.local.response.type = "pdf"
 
 
 def get_file_data_from_writer(writer_obj):
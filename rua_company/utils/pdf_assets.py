@@ -0,0 +1,185 @@
+import base64
+import hashlib
+import html
+import os
+import re
+import tempfile
+from functools import lru_cache
+from urllib.parse import unquote, urlsplit
+
+import frappe
+
+CSS_CACHE_DIR = os.path.join(tempfile.gettempdir(), "rua-pdf-css")
+CSS_URL_PATTERN = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+LINK_TAG_PATTERN = re.compile(r"<link\b[^>]*>", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r'([\w-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))')
+
+# Fonts are inlined: Chrome will not load them from file:// into a file:// page
+FONT_TYPES = {
+    ".woff2": "font/woff2",
+    ".woff": "font/woff",
+    ".ttf": "font/ttf",
+    ".otf": "font/otf",
+}
+
+
+def inline_stylesheets(html_text: str, site_url: str) -> str:
+    """Replace <link rel="stylesheet"> tags for app stylesheets with <style> elements
+
+    paged.js re-fetches linked stylesheets with XMLHttpRequest, which Chrome
+    refuses between file:// URLs, so their localized text is inlined instead.
+    """
+    def inline(match):
+        attributes = {
+            name.lower(): next((value for value in values if value), "")
+            for name, *values in ATTRIBUTE_PATTERN.findall(match.group(0))
+        }
+        if "stylesheet" not in attributes.get("rel", "").lower().split():
+            return match.group(0)
+
+        href = html.unescape(attributes.get("href", ""))
+        for prefix in (site_url, site_url.replace("https://", "http://")):
+            if href.startswith(prefix):
+                href = href[len(prefix):]
+                break
+
+        css = get_stylesheet_text(href)
+        if css is None:
+            return match.group(0)
+
+        media = attributes.get("media")
+        return f'<style media="{html.escape(media)}">{css}</style>' if media else f"<style>{css}</style>"
+
+    return LINK_TAG_PATTERN.sub(inline, html_text)
+
+
+def get_stylesheet_text(url: str) -> str | None:
+    """Localized text of an app stylesheet, or None if it cannot be inlined"""
+    parts = urlsplit(url)
+    if parts.scheme or parts.netloc or not unquote(parts.path).startswith("/assets/"):
+        return None
+
+    path = get_local_path(url)
+    if not path or not path.endswith(".css"):
+        return None
+
+    with open(get_localized_stylesheet(path), encoding="utf-8") as f:
+        css = f.read()
+
+    # Would close the <style> element early
+    return None if "</style" in css.lower() else css
+
+
+def resolve_local_url(url: str) -> str | None:
+    """file:// (or data:) URL for a site asset or public file, or None if it is not local
+
+    App stylesheets are served from a rewritten copy whose own url() references
+    are local too, since root-relative paths mean nothing under file://.
+    """
+    path = get_local_path(url)
+    if not path:
+        return None
+
+    if path.endswith(".css"):
+        # Only app stylesheets are trusted to have their references followed on disk
+        if not unquote(urlsplit(url).path).startswith("/assets/"):
+            return None
+        return f"file://{get_localized_stylesheet(path)}"
+
+    return get_file_url(path)
+
+
+def get_file_url(path: str) -> str:
+    if font_type := FONT_TYPES.get(os.path.splitext(path)[1].lower()):
+        return get_font_data_uri(path, font_type, os.stat(path).st_mtime_ns)
+    return f"file://{path}"
+
+
+@lru_cache(maxsize=32)
+def get_font_data_uri(path: str, font_type: str, mtime_ns: int) -> str:
+    with open(path, "rb") as f:
+        return f"data:{font_type};base64,{base64.b64encode(f.read()).decode()}"
+
+
+def get_local_path(url: str) -> str | None:
+    """Map /assets/... and /files/... to the filesystem
+
+    Private files are left to Chrome to fetch over HTTP with the requesting
+    user's session, so File permissions keep applying to them.
+    """
+    path = unquote(urlsplit(url).path)
+    if ".." in path.split("/"):
+        return None
+
+    if path.startswith("/assets/"):
+        app, _, relative = path[len("/assets/"):].partition("/")
+        if app not in frappe.get_installed_apps():
+            return None
+        local_path = os.path.join(frappe.local.sites_path, "assets", app, relative)
+        roots = get_asset_roots(app)
+    elif path.startswith("/files/"):
+        local_path = frappe.get_site_path("public", "files", path[len("/files/"):])
+        roots = [os.path.realpath(frappe.get_site_path("public", "files"))]
+    else:
+        return None
+
+    # Assets are symlinks into the apps, so check where the path really leads
+    local_path = os.path.realpath(local_path)
+    if not any(local_path.startswith(root + os.sep) for root in roots):
+        return None
+
+    return local_path if os.path.isfile(local_path) else None
+
+
+def get_asset_roots(app: str) -> list[str]:
+    """Directories bench publishes under /assets/<app>: public and node_modules"""
+    return [
+        os.path.realpath(frappe.get_app_path(app, "public")),
+        os.path.realpath(os.path.join(frappe.get_app_path(app), "..", "node_modules")),
+    ]
+
+
+def get_localized_stylesheet(css_path: str) -> str:
+    """Copy of a stylesheet with every url() pointing at a local file, cached by mtime"""
+    stat = os.stat(css_path)
+    key = hashlib.sha1(f"{css_path}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()
+    cached_path = os.path.join(CSS_CACHE_DIR, f"{key}.css")
+    if os.path.exists(cached_path):
+        return cached_path
+
+    css_dir = os.path.dirname(css_path)
+
+    def localize(match):
+        quote, ref = match.groups()
+        if ref.startswith(("data:", "http:", "https:", "file:", "#")):
+            return match.group(0)
+
+        if ref.startswith("/"):
+            local = get_local_path(ref)
+        else:
+            parts = urlsplit(ref)
+            local = os.path.normpath(os.path.join(css_dir, unquote(parts.path)))
+            local = local if os.path.isfile(local) else None
+
+        if not local:
+            return match.group(0)
+
+        local_url = get_file_url(local)
+        if local_url.startswith("data:"):
+            return f"url({quote}{local_url}{quote})"
+
+        # Keep fragments such as sprite anchors
+        fragment = urlsplit(ref).fragment
+        return f"url({quote}{local_url}{'#' + fragment if fragment else ''}{quote})"
+
+    with open(css_path, encoding="utf-8", errors="replace") as f:
+        css = CSS_URL_PATTERN.sub(localize, f.read())
+
+    os.makedirs(CSS_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CSS_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(css)
+    os.replace(tmp_path, cached_path)
+
+    return cached_path
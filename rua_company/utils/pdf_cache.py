@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import frappe
+
+DEFAULT_CACHE_SIZE_MB = 512
+EVICT_TO = 0.9  # fraction of the limit left after an eviction pass
+
+
+def get_cache_key(html: str, options: dict | None) -> str:
+    """Content address of a render: the HTML and options exactly as requested
+
+    Private files are fetched with the requesting user's session, so renders
+    that embed them are only shared with that same user.
+    """
+    digest = hashlib.sha256(html.encode())
+    digest.update(json.dumps(options or {}, sort_keys=True, default=str).encode())
+    if "/private/files/" in html:
+        digest.update(frappe.session.user.encode())
+    return digest.hexdigest()
+
+
+def get(key: str) -> bytes | None:
+    if not get_size_limit():
+        return None
+
+    path = get_path(key)
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+    except FileNotFoundError:
+        return None
+
+    # Touch the entry so eviction is least-recently-used
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return content
+
+
+def put(key: str, content: bytes):
+    limit = get_size_limit()
+    if not limit or len(content) > limit:
+        return
+
+    cache_dir = get_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Write atomically so concurrent readers never see a partial PDF
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, get_path(key))
+
+    evict(cache_dir, limit)
+
+
+def evict(cache_dir: str, limit: int):
+    """Delete least recently used entries once the cache outgrows `limit` bytes"""
+    entries = []
+    total = 0
+    for entry in os.scandir(cache_dir):
+        if not entry.name.endswith(".pdf"):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+
+    if total <= limit:
+        return
+
+    for _mtime, size, path in sorted(entries):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        if total <= limit * EVICT_TO:
+            break
+
+
+def get_cache_dir() -> str:
+    return frappe.get_site_path("private", "pdf_cache")
+
+
+def get_path(key: str) -> str:
+    return os.path.join(get_cache_dir(), f"{key}.pdf")
+
+
+def get_size_limit() -> int:
+    """Cache size in bytes; rua_pdf_cache_size_mb = 0 disables the cache"""
+    size_mb = frappe.conf.get("rua_pdf_cache_size_mb")
+    if size_mb is None:
+        size_mb = DEFAULT_CACHE_SIZE_MB
+    return int(size_mb) * 1024 * 1024
@@ -0,0 +1,22 @@
+import hashlib
+
+import frappe
+import segno
+
+QR_CODE_CACHE_TTL = 7 * 24 * 60 * 60
+
+
+def get_qr_code_data_uri(text: str, dark: str = "171717", light: str = "f0f0f0") -> str:
+    """SVG data URI of a QR code for `text`, generated locally and cached for a week
+
+    Exposed to print formats as a Jinja method.
+    """
+    key = "rua_qr_code::" + hashlib.sha1(f"{text}:{dark}:{light}".encode()).hexdigest()
+
+    data_uri = frappe.cache.get_value(key)
+    if data_uri is None:
+        qr = segno.make_qr(text, error="m")
+        data_uri = qr.svg_data_uri(dark=f"#{dark}", light=f"#{light}", border=0)
+        frappe.cache.set_value(key, data_uri, expires_in_sec=QR_CODE_CACHE_TTL)
+
+    return data_uri
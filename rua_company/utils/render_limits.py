@@ -0,0 +1,118 @@
+import fcntl
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe import _
+
+SLOT_DIR = os.path.join(tempfile.gettempdir(), "rua-pdf-slots")
+DEFAULT_QUEUE_TIMEOUT = 30  # seconds a render may wait for a free slot
+SLOW_WAIT = 2  # seconds of queueing worth a log line
+POLL_INTERVAL = 0.05
+
+METRICS_KEY = "rua_pdf_render_metrics"
+
+
+@contextmanager
+def render_slot():
+    """Hold one of the host's PDF render slots for the duration of a render
+
+    Slots are lock files shared by every worker process on the host; the
+    kernel releases a slot if its holder dies, so no slot can leak.
+    """
+    started = time.monotonic()
+    slot = acquire_slot(get_max_renders(), get_queue_timeout())
+    waited = time.monotonic() - started
+
+    if slot is None:
+        record_metrics(rejected=1)
+        frappe.throw(
+            _("Too many documents are being printed right now. Please try again in a moment."),
+            title=_("PDF Rendering Busy"),
+        )
+
+    if waited > SLOW_WAIT:
+        frappe.logger("rua_pdf").warning(f"PDF render waited {waited:.2f}s for a slot")
+
+    rendering = time.monotonic()
+    timed_out = False
+    try:
+        yield
+    except TimeoutError:
+        timed_out = True
+        raise
+    finally:
+        os.close(slot)
+        record_metrics(
+            renders=1,
+            timeouts=int(timed_out),
+            wait_ms=int(waited * 1000),
+            render_ms=int((time.monotonic() - rendering) * 1000),
+        )
+
+
+def acquire_slot(max_slots, timeout, slot_dir=SLOT_DIR):
+    """Lock a free slot file and return its descriptor, or None after `timeout`"""
+    os.makedirs(slot_dir, exist_ok=True)
+    deadline = time.monotonic() + timeout
+
+    while True:
+        for index in range(max_slots):
+            fd = os.open(os.path.join(slot_dir, f"slot-{index}.lock"), os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(POLL_INTERVAL)
+
+
+def record_metrics(**values):
+    try:
+        key = frappe.cache.make_key(METRICS_KEY)
+        pipeline = frappe.cache.pipeline()
+        for field, value in values.items():
+            if value:
+                pipeline.hincrby(key, field, value)
+        pipeline.execute()
+    except Exception:
+        # Metrics must never fail a print
+        frappe.logger("rua_pdf").exception("Could not record PDF render metrics")
+
+
+@frappe.whitelist()
+def get_render_metrics():
+    """Totals since the last reset, with average queue wait and render time"""
+    frappe.only_for("System Manager")
+
+    # Counters are plain HINCRBY integers, so read them raw rather than through
+    # the cache wrapper, which would prefix the key again and unpickle values
+    pipeline = frappe.cache.pipeline()
+    pipeline.hgetall(frappe.cache.make_key(METRICS_KEY))
+    raw = pipeline.execute()[0] or {}
+    metrics = {frappe.safe_decode(field): int(value) for field, value in raw.items()}
+    renders = metrics.get("renders", 0)
+
+    metrics["max_concurrent_renders"] = get_max_renders()
+    metrics["avg_wait_ms"] = metrics.get("wait_ms", 0) / renders if renders else 0
+    metrics["avg_render_ms"] = metrics.get("render_ms", 0) / renders if renders else 0
+    return metrics
+
+
+@frappe.whitelist(methods=["POST"])
+def reset_render_metrics():
+    frappe.only_for("System Manager")
+    frappe.cache.delete(frappe.cache.make_key(METRICS_KEY))
+
+
+def get_max_renders():
+    return int(frappe.conf.get("rua_pdf_max_concurrent_renders") or os.cpu_count() or 2)
+
+
+def get_queue_timeout():
+    return int(frappe.conf.get("rua_pdf_queue_timeout") or DEFAULT_QUEUE_TIMEOUT)
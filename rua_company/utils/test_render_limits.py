@@ -0,0 +1,38 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from rua_company.utils.render_limits import get_render_metrics, render_slot, reset_render_metrics
+
+
+class TestRenderLimits(FrappeTestCase):
+    def setUp(self):
+        frappe.set_user("Administrator")
+        reset_render_metrics()
+
+    def tearDown(self):
+        reset_render_metrics()
+
+    def test_render_is_counted(self):
+        with render_slot():
+            pass
+
+        metrics = get_render_metrics()
+        self.assertEqual(metrics["renders"], 1)
+        self.assertEqual(metrics.get("rejected", 0), 0)
+        self.assertIn("avg_render_ms", metrics)
+
+    def test_timeout_is_counted(self):
+        with self.assertRaises(TimeoutError):
+            with render_slot():
+                raise TimeoutError
+
+        metrics = get_render_metrics()
+        self.assertEqual(metrics["renders"], 1)
+        self.assertEqual(metrics["timeouts"], 1)
+
+    def test_reset(self):
+        with render_slot():
+            pass
+
+        reset_render_metrics()
+        self.assertEqual(get_render_metrics().get("renders", 0), 0)